@@ -0,0 +1,13 @@
+"""
+_path.py
+Put the repository root first on sys.path, so that the benchmarks run
+on the gnucashxml of this checkout whether it is installed or not
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
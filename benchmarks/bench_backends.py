@@ -0,0 +1,49 @@
+"""
+bench_backends.py
+Compare load time of the lxml and stdlib XML backends across book sizes
+"""
+
+import argparse
+import io
+import time
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+LOADERS = [
+    ("tree", {}),
+    ("streaming", {"streaming": True}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="numbers of transactions")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    backends = sorted(gnucashxml._BACKENDS)
+    print("default backend: {}".format(gnucashxml.BACKEND))
+    print("{:>12} {:10}".format("transactions", "loader") +
+          "".join(" {:>10}".format(backend) for backend in backends))
+    for size in args.sizes:
+        fobj = io.BytesIO()
+        write_book(fobj, transactions=size, accounts=200, slot_density=0.1)
+        data = fobj.getvalue()
+        for name, kwargs in LOADERS:
+            row = "{:12} {:10}".format(size, name)
+            for backend in backends:
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    gnucashxml.parse(io.BytesIO(data), backend=backend, **kwargs)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                row += " {:9.2f}s".format(best)
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
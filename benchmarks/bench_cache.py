@@ -0,0 +1,44 @@
+"""
+bench_cache.py
+Compare parsing a book with loading it from the on-disk cache
+"""
+
+import argparse
+import gzip
+import os
+import tempfile
+import time
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--transactions", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "book.gnucash")
+        cache_dir = os.path.join(tmp, "cache")
+        with gzip.open(filename, "wb") as fobj:
+            write_book(fobj, transactions=args.transactions)
+
+        timings = []
+        for name in ["parse", "parse+store", "cached"]:
+            start = time.perf_counter()
+            if name == "parse":
+                gnucashxml.from_filename(filename)
+            else:
+                gnucashxml.from_filename(filename, cache_dir=cache_dir)
+            timings.append(time.perf_counter() - start)
+            print("  {:12} {:8.2f} s".format(name, timings[-1]))
+        size = sum(os.path.getsize(os.path.join(cache_dir, name))
+                   for name in os.listdir(cache_dir))
+        print("  speedup      {:8.1f}x, cache {:.1f} MiB, book {:.1f} MiB".format(
+            timings[0] / timings[2], size / 2**20, os.path.getsize(filename) / 2**20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+bench_dates.py
+Compare load time with dateutil and with the fast timestamp parser
+"""
+
+import argparse
+import gzip
+import os
+import tempfile
+import time
+import timeit
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+
+def load(filename, parse_date):
+    saved = gnucashxml._parse_date
+    gnucashxml._parse_date = parse_date
+    try:
+        start = time.perf_counter()
+        gnucashxml.from_filename(filename)
+        return time.perf_counter() - start
+    finally:
+        gnucashxml._parse_date = saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--splits", type=int, default=1000000,
+                        help="total number of splits in the book")
+    args = parser.parse_args()
+
+    stamp = "2017-06-30 10:59:00 +0200"
+    number = 100000
+    print("per call, {} calls".format(number))
+    for name, func in [("dateutil", gnucashxml.parse_date),
+                       ("fast", gnucashxml._parse_date.__wrapped__),
+                       ("fast+cache", gnucashxml._parse_date)]:
+        seconds = timeit.timeit(lambda: func(stamp), number=number)
+        print("  {:12} {:8.2f} us".format(name, seconds / number * 1e6))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "book.gnucash")
+        with gzip.open(filename, "wb") as fobj:
+            write_book(fobj, transactions=args.splits // 2, splits=2,
+                       slot_density=0.2)
+        print("load, {} splits".format(args.splits))
+        slow = load(filename, gnucashxml.parse_date)
+        print("  {:12} {:8.1f} s".format("dateutil", slow))
+        gnucashxml._parse_date.cache_clear()
+        fast = load(filename, gnucashxml._parse_date)
+        print("  {:12} {:8.1f} s  ({:.1f}x)".format("fast", fast, slow / fast))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+bench_io.py
+Compare ways of opening compressed and plain books for parsing
+"""
+
+import argparse
+import gzip
+import mmap
+import os
+import tempfile
+import time
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+
+def gzip_then_plain(filename, **kwargs):
+    """The original from_filename: try gzip, reopen as plain on failure."""
+    try:
+        return gnucashxml.parse(gzip.open(filename, "rb"), **kwargs)
+    except IOError:
+        return gnucashxml.parse(open(filename, "rb"), **kwargs)
+
+
+def with_gzip(filename, **kwargs):
+    with gzip.open(filename, "rb") as fobj:
+        return gnucashxml.parse(fobj, **kwargs)
+
+
+def with_thread(filename, **kwargs):
+    with gnucashxml._InflatingReader(gzip.open(filename, "rb")) as fobj:
+        return gnucashxml.parse(fobj, **kwargs)
+
+
+def with_open(filename, **kwargs):
+    with open(filename, "rb") as fobj:
+        return gnucashxml.parse(fobj, **kwargs)
+
+
+def with_mmap(filename, **kwargs):
+    with open(filename, "rb") as fobj:
+        mapped = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+    with mapped:
+        return gnucashxml.parse(mapped, **kwargs)
+
+
+def inflate_only(filename, **kwargs):
+    with gzip.open(filename, "rb") as fobj:
+        while fobj.read(2**20):
+            pass
+
+
+CASES = [
+    ("gzip", [("inflate only", inflate_only),
+              ("gzip, then plain", gzip_then_plain),
+              ("gzip.open", with_gzip),
+              ("inflate thread", with_thread),
+              ("from_filename", gnucashxml.from_filename)]),
+    ("plain", [("gzip, then plain", gzip_then_plain),
+               ("open", with_open),
+               ("mmap", with_mmap),
+               ("from_filename", gnucashxml.from_filename)]),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--transactions", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--streaming", action="store_true")
+    args = parser.parse_args()
+
+    print("{} CPUs, backend {}".format(os.cpu_count(), gnucashxml.BACKEND))
+    with tempfile.TemporaryDirectory() as tmp:
+        files = {"gzip": os.path.join(tmp, "book.gnucash"),
+                 "plain": os.path.join(tmp, "book.xml")}
+        with gzip.open(files["gzip"], "wb") as fobj:
+            write_book(fobj, transactions=args.transactions)
+        with open(files["plain"], "wb") as fobj:
+            write_book(fobj, transactions=args.transactions)
+
+        for kind, loaders in CASES:
+            print("{} book, {} transactions".format(kind, args.transactions))
+            for name, load in loaders:
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    load(files[kind], streaming=args.streaming)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                print("  {:18} {:8.2f} s".format(name, best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+bench_ledger.py
+Time Book.ledger() with and without cached account full names
+"""
+
+import argparse
+import io
+import time
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+
+def fullname_uncached(self):
+    """The original implementation, rebuilding the path on every call."""
+    if self.parent:
+        pfn = fullname_uncached(self.parent)
+        if pfn:
+            return '{}:{}'.format(pfn, self.name)
+        else:
+            return self.name
+    else:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--accounts", type=int, default=500)
+    parser.add_argument("--depth", type=int, default=12)
+    args = parser.parse_args()
+
+    fobj = io.BytesIO()
+    write_book(fobj, accounts=args.accounts, depth=args.depth,
+               transactions=args.transactions, slot_density=0)
+    fobj.seek(0)
+    book = gnucashxml.parse(fobj)
+    print("book: {} accounts, depth {}, {} transactions".format(
+        args.accounts, args.depth, args.transactions))
+
+    cached = gnucashxml.Account.fullname
+    timings = []
+    for name, fullname in [("uncached", fullname_uncached), ("cached", cached)]:
+        gnucashxml.Account.fullname = fullname
+        try:
+            start = time.perf_counter()
+            output = book.ledger()
+            timings.append(time.perf_counter() - start)
+        finally:
+            gnucashxml.Account.fullname = cached
+        print("  {:10} {:8.2f} s  ({} bytes)".format(name, timings[-1], len(output)))
+    print("  speedup    {:8.1f}x".format(timings[0] / timings[1]))
+
+    # Amounts are hundredths, so exact fractions must print the same
+    fobj.seek(0)
+    assert gnucashxml.parse(fobj, exact=True).ledger() == output
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+bench_memory.py
+Compare peak RSS of the tree loader, the streaming loader and the lazy
+transaction iterator on a synthetic book
+"""
+
+import argparse
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+
+from _path import ROOT
+from synthbook import write_book
+
+# Each loader runs in a fresh interpreter, so that ru_maxrss is not
+# polluted by the generator or by the other loader.
+CHILD = """
+import resource, sys, time
+import gnucashxml
+filename = sys.argv[1]
+start = time.perf_counter()
+count = {expression}
+elapsed = time.perf_counter() - start
+# ru_maxrss is in KiB on Linux and bytes on macOS
+scale = 1 if sys.platform == "darwin" else 1024
+print(count, elapsed,
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale)
+"""
+
+LOADERS = [
+    ("tree", "len(gnucashxml.from_filename(filename).transactions)"),
+    ("streaming", "len(gnucashxml.from_filename(filename, streaming=True).transactions)"),
+    ("iterator", "sum(1 for _ in gnucashxml.iter_transactions(filename))"),
+]
+
+
+def measure(filename, expression):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, env.get("PYTHONPATH", "")])
+    out = subprocess.check_output([sys.executable, "-c",
+                                   CHILD.format(expression=expression), filename],
+                                  env=env)
+    count, elapsed, peak = out.split()
+    return int(count), float(elapsed), int(peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--accounts", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "book.gnucash")
+        with gzip.open(filename, "wb") as fobj:
+            write_book(fobj, accounts=args.accounts,
+                       transactions=args.transactions)
+        print("book: {} transactions, {:.1f} MiB compressed".format(
+            args.transactions, os.path.getsize(filename) / 2**20))
+        print("{:12} {:>10} {:>14}".format("loader", "seconds", "peak RSS MiB"))
+        for name, expression in LOADERS:
+            count, elapsed, peak = measure(filename, expression)
+            assert count == args.transactions
+            print("{:12} {:10.2f} {:14.1f}".format(name, elapsed, peak / 2**20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+bench_numbers.py
+Micro-benchmarks of the numerator/denominator conversion in _parse_number
+"""
+
+import decimal
+import random
+import timeit
+
+import _path  # noqa: F401
+import gnucashxml
+
+
+def parse_number_divide(numstring):
+    """The original implementation: two Decimals and a division."""
+    num, denum = numstring.split("/")
+    return decimal.Decimal(num) / decimal.Decimal(denum)
+
+
+def main():
+    rng = random.Random(0)
+    # A realistic mix: many repeated round amounts, some unique ones,
+    # a few prices with non power of ten denominators.
+    samples = (["0/1", "-5000/100", "5000/100", "1000/1"] * 250 +
+               ["{}/100".format(rng.randint(-10**6, 10**6)) for _ in range(3000)] +
+               ["{}/3".format(rng.randint(1, 10**4)) for _ in range(100)])
+    rng.shuffle(samples)
+
+    for numstring in samples:
+        assert gnucashxml._parse_number(numstring) == parse_number_divide(numstring)
+        assert str(gnucashxml._parse_number(numstring)) == str(parse_number_divide(numstring))
+
+    candidates = [
+        ("divide", parse_number_divide),
+        ("interned", gnucashxml._parse_number.__wrapped__),
+        ("interned+cache", gnucashxml._parse_number),
+        ("fraction", gnucashxml._parse_fraction.__wrapped__),
+        ("fraction+cache", gnucashxml._parse_fraction),
+    ]
+    print("per call, {} samples".format(len(samples)))
+    for name, func in candidates:
+        func(samples[0])
+        seconds = min(timeit.repeat(lambda: [func(s) for s in samples],
+                                    number=10, repeat=5))
+        print("  {:16} {:8.3f} us".format(name, seconds / 10 / len(samples) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
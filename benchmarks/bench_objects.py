@@ -0,0 +1,54 @@
+"""
+bench_objects.py
+Measure the heap bytes per split of a loaded book
+
+Exits with status 1 if the result exceeds --max-bytes-per-split, so it
+can be used as a memory regression check.
+"""
+
+import argparse
+import gc
+import io
+import sys
+import tracemalloc
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--splits", type=int, default=2)
+    parser.add_argument("--slot-density", type=float, default=0.1)
+    parser.add_argument("--max-bytes-per-split", type=float, default=None)
+    args = parser.parse_args()
+
+    fobj = io.BytesIO()
+    write_book(fobj, transactions=args.transactions, splits=args.splits,
+               slot_density=args.slot_density)
+    fobj.seek(0)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # Streaming, so that only the objects of the book remain
+    book = gnucashxml.parse(fobj, streaming=True)
+    gnucashxml._parse_number.cache_clear()
+    gnucashxml._parse_date.cache_clear()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    splits = sum(len(trn.splits) for trn in book.transactions)
+    per_split = used / splits
+    print("{} splits, {:.1f} MiB, {:.0f} bytes per split".format(
+        splits, used / 2**20, per_split))
+    if args.max_bytes_per_split is not None and per_split > args.max_bytes_per_split:
+        print("more than {:.0f} bytes per split".format(args.max_bytes_per_split))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+bench_parallel.py
+Report the speedup of parsing with 1, 2, 4, 8 and 16 worker processes
+"""
+
+import argparse
+import gzip
+import os
+import tempfile
+import time
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--transactions", type=int, default=200000)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "book.gnucash")
+        with gzip.open(filename, "wb") as fobj:
+            write_book(fobj, transactions=args.transactions)
+        print("{} transactions, {} CPUs".format(args.transactions, os.cpu_count()))
+        print("{:>8} {:>10} {:>8}".format("workers", "seconds", "speedup"))
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            book = gnucashxml.from_filename(filename, workers=workers)
+            elapsed = time.perf_counter() - start
+            assert len(book.transactions) == args.transactions
+            baseline = baseline or elapsed
+            print("{:8} {:10.2f} {:8.2f}".format(workers, elapsed, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_slots.py
+Cost of slot frames on a book with online banking metadata everywhere:
+loading, then decoding all of them (a no-op where loading decoded them)
+"""
+
+import argparse
+import concurrent.futures
+import os
+import resource
+import tempfile
+import time
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+LOADERS = [
+    ("tree", {}),
+    ("streaming", {"streaming": True}),
+    ("keep_tree", {"streaming": True, "keep_tree": True}),
+]
+
+
+def load(filename, backend, kwargs, decode):
+    """Load in a fresh process, return seconds and peak RSS in MiB."""
+    start = time.perf_counter()
+    book = gnucashxml.from_filename(filename, backend=backend, **kwargs)
+    if decode:
+        for obj in book.accounts:
+            obj.slots
+        for trn in book.transactions:
+            trn.slots
+            for split in trn.splits:
+                split.slots
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--slot-density", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "book.xml")
+        with open(filename, "wb") as fobj:
+            write_book(fobj, transactions=args.transactions,
+                       slot_density=args.slot_density)
+        print("{} transactions, slot density {}".format(args.transactions,
+                                                       args.slot_density))
+        print("{:8} {:10} {:>10} {:>10} {:>10} {:>10}".format(
+            "backend", "loader", "load", "peak", "+decode", "peak"))
+        for backend in sorted(gnucashxml._BACKENDS):
+            for name, kwargs in LOADERS:
+                row = "{:8} {:10}".format(backend, name)
+                for decode in (False, True):
+                    best = peak = None
+                    for _ in range(args.repeat):
+                        with concurrent.futures.ProcessPoolExecutor(1) as pool:
+                            elapsed, rss = pool.submit(load, filename, backend,
+                                                       kwargs, decode).result()
+                        best = elapsed if best is None else min(best, elapsed)
+                        peak = rss if peak is None else min(peak, rss)
+                    row += " {:9.2f}s {:6.0f} MiB".format(best, peak)
+                print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+bench_sqlite.py
+Throughput and peak memory of the SQLite export, streaming from the
+file and from a loaded book
+"""
+
+import argparse
+import concurrent.futures
+import gzip
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+TABLES = ("commodities", "accounts", "transactions", "splits", "prices", "slots")
+
+
+def export(filename, path, how):
+    """Export in a fresh process, return seconds and peak RSS in MiB."""
+    start = time.perf_counter()
+    if how == "write_sqlite":
+        gnucashxml.write_sqlite(filename, path)
+    else:
+        book = gnucashxml.from_filename(filename, streaming=True)
+        if how == "to_sqlite":
+            start = time.perf_counter()
+        book.to_sqlite(path)
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000],
+                        help="numbers of transactions")
+    parser.add_argument("--splits", type=int, default=3,
+                        help="splits per transaction")
+    args = parser.parse_args()
+
+    print("{:>12} {:20} {:>10} {:>9} {:>10} {:>9}".format(
+        "transactions", "export", "rows", "seconds", "rows/s", "peak"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            # Compressed, as plain files are memory mapped and would
+            # count in the peak RSS
+            filename = os.path.join(tmp, "book.gnucash")
+            with gzip.open(filename, "wb") as fobj:
+                write_book(fobj, transactions=size, splits=args.splits)
+            for how in ("write_sqlite", "load + to_sqlite", "to_sqlite"):
+                path = os.path.join(tmp, "book.sqlite")
+                with concurrent.futures.ProcessPoolExecutor(1) as pool:
+                    elapsed, rss = pool.submit(export, filename, path, how).result()
+                with sqlite3.connect(path) as connection:
+                    rows = sum(connection.execute(
+                        "SELECT count(*) FROM {}".format(table)).fetchone()[0]
+                        for table in TABLES)
+                os.remove(path)
+                print("{:12} {:20} {:10} {:8.2f}s {:10.0f} {:5.0f} MiB".format(
+                    size, how, rows, elapsed, rows / elapsed, rss))
+
+
+if __name__ == "__main__":
+    main()
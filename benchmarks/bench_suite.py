@@ -0,0 +1,171 @@
+"""
+bench_suite.py
+Benchmark loading and querying a synthetic book, save the results as
+JSON and fail on regressions against a baseline
+"""
+
+import argparse
+import gc
+import gzip
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import _path  # noqa: F401
+import gnucashxml
+from synthbook import write_book
+
+BOOK_OPTIONS = ("accounts", "depth", "transactions", "splits", "prices",
+                "slot_density", "seed", "plain")
+
+
+def benchmarks(filename):
+    """Return (name, function) pairs, all run on the book in filename."""
+    book = gnucashxml.from_filename(filename)
+    names = [account.name for account in book.accounts]
+    guids = ([account.guid for account in book.accounts] +
+             [trn.guid for trn in book.transactions[:5000]] +
+             [split.guid for trn in book.transactions[:5000] for split in trn.splits])
+    busiest = max(book.accounts, key=lambda account: len(account.splits))
+
+    def multicolumn():
+        report = gnucashxml.multicolumn_matrix(gnucashxml.from_filename(filename),
+                                               busiest.fullname())
+        gnucashxml.write_multicolumn(io.StringIO(), *report)
+
+    return [
+        ("from_filename", lambda: gnucashxml.from_filename(filename)),
+        ("from_filename streaming",
+         lambda: gnucashxml.from_filename(filename, streaming=True)),
+        ("Book.find_account", lambda: [book.find_account(name) for name in names]),
+        ("Book.find_guid", lambda: [book.find_guid(guid) for guid in guids]),
+        ("Account.get_all_splits", book.root_account.get_all_splits),
+        ("Book.ledger", book.ledger),
+        ("multicolumn", multicolumn),
+    ]
+
+
+def measure(function, repeat):
+    """Return best wall time, peak traced memory and blocks kept by function.
+
+    Memory is measured on a separate run, as tracing slows everything
+    down. Only allocations through Python are traced: lxml's own memory
+    is not included.
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks
+    del result
+    return {"seconds": best, "peak_bytes": peak, "blocks": blocks}
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """Print results against baseline, return the list of regressions."""
+    regressions = []
+    print("{:24} {:>10} {:>8} {:>12} {:>8} {:>10} {:>8}".format(
+        "benchmark", "seconds", "ratio", "peak MiB", "ratio", "blocks", "ratio"))
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name) if baseline else None
+        row = "{:24}".format(name)
+        # Differences below slack are noise, whatever the ratio
+        for metric, scale, fmt, tolerance, slack in [
+                ("seconds", 1, "{:10.3f}", time_tolerance, 0.01),
+                ("peak_bytes", 2**20, "{:12.1f}", memory_tolerance, 2**20),
+                ("blocks", 1, "{:10.0f}", memory_tolerance, 1000)]:
+            value = result[metric]
+            row += " " + fmt.format(value / scale)
+            if base is None or base[metric] <= 0:
+                row += " {:>8}".format("")
+                continue
+            ratio = value / base[metric]
+            row += " {:7.2f}x".format(ratio)
+            if ratio > 1 + tolerance and value - base[metric] > slack:
+                regressions.append("{} {}: {:.2f}x the baseline".format(name, metric, ratio))
+        print(row)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--splits", type=int, default=3)
+    parser.add_argument("--prices", type=int, default=1000)
+    parser.add_argument("--slot-density", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plain", action="store_true",
+                        help="uncompressed XML instead of gzip")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", metavar="NAME",
+                        help="run only these benchmarks")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--time-tolerance", type=float, default=0.25,
+                        help="allowed slowdown as a fraction (default 0.25)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10,
+                        help="allowed memory growth as a fraction (default 0.10)")
+    args = parser.parse_args()
+
+    baseline = None
+    book_options = {option: getattr(args, option) for option in BOOK_OPTIONS}
+    if args.baseline:
+        with open(args.baseline) as fobj:
+            baseline = json.load(fobj)
+        if baseline["book"] != book_options:
+            parser.error("the baseline was run on a different book: {}".format(
+                baseline["book"]))
+
+    results = {
+        "book": book_options,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": gnucashxml.BACKEND,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "book.xml" if args.plain else "book.gnucash")
+        with (open if args.plain else gzip.open)(filename, "wb") as fobj:
+            write_book(fobj, accounts=args.accounts, depth=args.depth,
+                       transactions=args.transactions, splits=args.splits,
+                       prices=args.prices, slot_density=args.slot_density,
+                       seed=args.seed)
+        for name, function in benchmarks(filename):
+            if args.only and name not in args.only:
+                continue
+            results["benchmarks"][name] = measure(function, args.repeat)
+
+    regressions = compare(results, baseline, args.time_tolerance,
+                          args.memory_tolerance)
+    if args.output:
+        with open(args.output, "w") as fobj:
+            json.dump(results, fobj, indent=2)
+            fobj.write("\n")
+    if regressions:
+        print()
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
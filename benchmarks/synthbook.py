@@ -0,0 +1,231 @@
+"""
+synthbook.py
+Write a synthetic GNU Cash v2 XML book for benchmarking
+"""
+
+import argparse
+import datetime
+import gzip
+import random
+import uuid
+from xml.sax.saxutils import escape
+
+NAMESPACES = ["gnc", "act", "book", "cd", "cmdty", "price", "slot",
+              "split", "sx", "trn", "ts", "fs", "bgt", "recurrence",
+              "lot", "addr", "owner", "billterm", "bt-days", "bt-prox",
+              "cust", "employee", "entry", "invoice", "job", "order",
+              "taxtable", "tte", "vendor"]
+
+ACTYPES = ["ASSET", "BANK", "EXPENSE", "INCOME", "LIABILITY", "EQUITY"]
+
+
+def _guid(rng):
+    return uuid.UUID(int=rng.getrandbits(128)).hex
+
+
+def _date(when):
+    return "{:%Y-%m-%d %H:%M:%S} +0000".format(when)
+
+
+def _cmdty(tag, space, symbol):
+    return ("<{0}>\n  <cmdty:space>{1}</cmdty:space>\n"
+            "  <cmdty:id>{2}</cmdty:id>\n</{0}>\n").format(tag, space, symbol)
+
+
+def _slots(tag, rng, when):
+    """Online banking style slot frame, as written by the OFX importer."""
+    return ("<{0}>\n"
+            "  <slot>\n"
+            "    <slot:key>online_id</slot:key>\n"
+            "    <slot:value type=\"string\">{1}</slot:value>\n"
+            "  </slot>\n"
+            "  <slot>\n"
+            "    <slot:key>notes</slot:key>\n"
+            "    <slot:value type=\"string\">imported</slot:value>\n"
+            "  </slot>\n"
+            "  <slot>\n"
+            "    <slot:key>date-posted</slot:key>\n"
+            "    <slot:value type=\"gdate\">\n"
+            "      <gdate>{2:%Y-%m-%d}</gdate>\n"
+            "    </slot:value>\n"
+            "  </slot>\n"
+            "  <slot>\n"
+            "    <slot:key>import</slot:key>\n"
+            "    <slot:value type=\"frame\">\n"
+            "      <slot>\n"
+            "        <slot:key>amount</slot:key>\n"
+            "        <slot:value type=\"numeric\">{3}/100</slot:value>\n"
+            "      </slot>\n"
+            "      <slot>\n"
+            "        <slot:key>when</slot:key>\n"
+            "        <slot:value type=\"timespec\">\n"
+            "          <ts:date>{4}</ts:date>\n"
+            "        </slot:value>\n"
+            "      </slot>\n"
+            "    </slot:value>\n"
+            "  </slot>\n"
+            "</{0}>\n").format(tag, _guid(rng), when,
+                               rng.randint(1, 100000), _date(when))
+
+
+def write_book(fobj, accounts=50, depth=3, transactions=1000, splits=2,
+               prices=100, slot_density=0.1, seed=0):
+    """Write a gnc-v2 XML book to the binary file object fobj.
+
+    accounts is the number of non-root accounts, arranged in a tree of
+    at most depth levels. Every transaction has the given number of
+    splits, and slot_density is the fraction of accounts, transactions
+    and splits that carry a slot frame.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2000, 1, 1)
+
+    def write(text):
+        fobj.write(text.encode("utf-8"))
+
+    write('<?xml version="1.0" encoding="utf-8" ?>\n<gnc-v2\n')
+    for ns in NAMESPACES:
+        write('     xmlns:{0}="http://www.gnucash.org/XML/{0}"\n'.format(ns))
+    write('>\n<gnc:count-data cd:type="book">1</gnc:count-data>\n')
+    write('<gnc:book version="2.0.0">\n')
+    write('<book:id type="guid">{}</book:id>\n'.format(_guid(rng)))
+    write(_slots("book:slots", rng, start))
+
+    currencies = ["EUR", "USD"]
+    stocks = ["STK{}".format(i) for i in range(10)]
+    for symbol in currencies:
+        write('<gnc:commodity version="2.0.0">\n'
+              '  <cmdty:space>ISO4217</cmdty:space>\n'
+              '  <cmdty:id>{}</cmdty:id>\n'
+              '  <cmdty:get_quotes/>\n'
+              '  <cmdty:quote_source>currency</cmdty:quote_source>\n'
+              '  <cmdty:quote_tz/>\n'
+              '</gnc:commodity>\n'.format(symbol))
+    for symbol in stocks:
+        write('<gnc:commodity version="2.0.0">\n'
+              '  <cmdty:space>NASDAQ</cmdty:space>\n'
+              '  <cmdty:id>{0}</cmdty:id>\n'
+              '  <cmdty:name>Stock {0}</cmdty:name>\n'
+              '  <cmdty:xcode>US000000{0}</cmdty:xcode>\n'
+              '  <cmdty:fraction>1</cmdty:fraction>\n'
+              '</gnc:commodity>\n'.format(symbol))
+
+    write('<gnc:pricedb version="1">\n')
+    for i in range(prices):
+        if i % 2:
+            commodity = _cmdty("price:commodity", "NASDAQ", rng.choice(stocks))
+        else:
+            commodity = _cmdty("price:commodity", "ISO4217", "USD")
+        when = start + datetime.timedelta(days=i % 7300)
+        write('<price>\n'
+              '  <price:id type="guid">{}</price:id>\n'
+              '{}{}'
+              '  <price:time>\n    <ts:date>{}</ts:date>\n  </price:time>\n'
+              '  <price:source>user:price-editor</price:source>\n'
+              '  <price:type>last</price:type>\n'
+              '  <price:value>{}/10000</price:value>\n'
+              '</price>\n'.format(_guid(rng), commodity,
+                                  _cmdty("price:currency", "ISO4217", "EUR"),
+                                  _date(when), rng.randint(5000, 500000)))
+    write('</gnc:pricedb>\n')
+
+    root_guid = _guid(rng)
+    write('<gnc:account version="2.0.0">\n'
+          '  <act:name>Root Account</act:name>\n'
+          '  <act:id type="guid">{}</act:id>\n'
+          '  <act:type>ROOT</act:type>\n'
+          '</gnc:account>\n'.format(root_guid))
+    # Accounts are attached to a random parent one level up, so that the
+    # tree is both wide and depth levels deep.
+    levels = [[root_guid]]
+    leaves = []
+    for i in range(accounts):
+        level = 1 + i % max(depth, 1)
+        while len(levels) <= level:
+            levels.append([])
+        parent = rng.choice(levels[level - 1] or levels[0])
+        guid = _guid(rng)
+        levels[level].append(guid)
+        leaves.append(guid)
+        write('<gnc:account version="2.0.0">\n'
+              '  <act:name>Account {}</act:name>\n'
+              '  <act:id type="guid">{}</act:id>\n'
+              '  <act:type>{}</act:type>\n'
+              '{}'
+              '  <act:commodity-scu>100</act:commodity-scu>\n'
+              '  <act:description>Synthetic account {}</act:description>\n'
+              '{}'
+              '  <act:parent type="guid">{}</act:parent>\n'
+              '</gnc:account>\n'.format(i, guid, ACTYPES[i % len(ACTYPES)],
+                                        _cmdty("act:commodity", "ISO4217", "EUR"),
+                                        i,
+                                        _slots("act:slots", rng, start)
+                                        if rng.random() < slot_density else "",
+                                        parent))
+
+    for i in range(transactions):
+        when = start + datetime.timedelta(minutes=rng.randrange(20 * 365 * 24 * 60))
+        write('<gnc:transaction version="2.0.0">\n'
+              '  <trn:id type="guid">{}</trn:id>\n'
+              '{}'
+              '  <trn:date-posted>\n    <ts:date>{}</ts:date>\n  </trn:date-posted>\n'
+              '  <trn:date-entered>\n    <ts:date>{}</ts:date>\n  </trn:date-entered>\n'
+              '  <trn:description>{}</trn:description>\n'
+              '{}'
+              '  <trn:splits>\n'.format(_guid(rng),
+                                        _cmdty("trn:currency", "ISO4217", "EUR"),
+                                        _date(when), _date(when),
+                                        escape("Transaction {} & co".format(i)),
+                                        _slots("trn:slots", rng, when)
+                                        if rng.random() < slot_density else ""))
+        amounts = [rng.randint(-100000, 100000) for _ in range(max(splits, 2) - 1)]
+        amounts.append(-sum(amounts))
+        for amount in amounts[:max(splits, 1)]:
+            reconciled = rng.choice("nnncy")
+            write('    <trn:split>\n'
+                  '      <split:id type="guid">{}</split:id>\n'
+                  '      <split:memo>memo {}</split:memo>\n'
+                  '      <split:reconciled-state>{}</split:reconciled-state>\n'
+                  '{}'
+                  '      <split:value>{}/100</split:value>\n'
+                  '      <split:quantity>{}/100</split:quantity>\n'
+                  '      <split:account type="guid">{}</split:account>\n'
+                  '{}'
+                  '    </trn:split>\n'.format(
+                      _guid(rng), i, reconciled,
+                      '      <split:reconcile-date>\n'
+                      '        <ts:date>{}</ts:date>\n'
+                      '      </split:reconcile-date>\n'.format(_date(when))
+                      if reconciled == "y" else "",
+                      amount, amount, rng.choice(leaves),
+                      _slots("split:slots", rng, when)
+                      if rng.random() < slot_density else ""))
+        write('  </trn:splits>\n</gnc:transaction>\n')
+
+    write('</gnc:book>\n</gnc-v2>\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("filename")
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--transactions", type=int, default=1000)
+    parser.add_argument("--splits", type=int, default=2)
+    parser.add_argument("--prices", type=int, default=100)
+    parser.add_argument("--slot-density", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plain", action="store_true",
+                        help="write uncompressed XML instead of gzip")
+    args = parser.parse_args()
+
+    opener = open if args.plain else gzip.open
+    with opener(args.filename, "wb") as fobj:
+        write_book(fobj, accounts=args.accounts, depth=args.depth,
+                   transactions=args.transactions, splits=args.splits,
+                   prices=args.prices, slot_density=args.slot_density,
+                   seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,16 +19,52 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import array
+import asyncio
+import bisect
+import collections
+import collections.abc
+import concurrent.futures
+import datetime
 import decimal
+import fractions
+import functools
 import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import mmap
+import os
+import pickle
+import queue
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+import weakref
+import xml.etree.ElementTree
 from dateutil.parser import parse as parse_date
 
 try:
-    import lxml.etree as ElementTree
+    import lxml.etree
 except ImportError:
-    from xml.etree import ElementTree
+    lxml = None
 from xml.etree.ElementTree import ParseError
 
+# XML backends by name: modules with the ElementTree API. The fastest
+# one available is the default, and reported by BACKEND.
+_BACKENDS = {'stdlib': xml.etree.ElementTree}
+_PARSE_ERRORS = (ParseError,)
+if lxml is not None:
+    _BACKENDS['lxml'] = lxml.etree
+    _PARSE_ERRORS += (lxml.etree.ParseError,)
+BACKEND = 'stdlib' if lxml is None else 'lxml'
+ElementTree = _BACKENDS[BACKEND]
+
 __version__ = "1.1"
 
 
@@ -38,60 +74,340 @@ class Book(object):
 
     It doesn't really do anything at all by itself, except to have
     a reference to the accounts, transactions, prices, and commodities.
+
+    Accounts, transactions, splits and prices are indexed by GUID, and
+    commodities by namespace and symbol, when the book is created. The
+    indexes are not updated if the lists are modified afterwards.
+    Transactions, and the splits of every account, are sorted by posting
+    date at the same time.
+
+    Prices are indexed by commodity and currency on the first price
+    lookup, and again whenever the number of prices has changed.
+
+    The slots of accounts, transactions and splits of a book with a tree
+    are decoded from it on first access. Setting tree to None decodes
+    the remaining ones, which would keep the whole tree alive otherwise.
     """
 
     def __init__(self, tree, guid, prices=None, transactions=None, root_account=None,
-                 accounts=None, commodities=None, slots=None):
-        self.tree = tree
+                 accounts=None, commodities=None, slots=None,
+                 accountdict=None, commoditydict=None):
+        self._tree = tree
         self.guid = guid
         self.prices = prices
         self.transactions = transactions or []
+        self.transactions.sort(key=_transaction_date)
         self.root_account = root_account
         self.accounts = accounts or []
         self.commodities = commodities or []
-        self.slots = slots or {}
+        self.slots = slots or _EMPTY_SLOTS
+
+        if accountdict is None:
+            accountdict = {acc.guid: acc for acc in self.accounts}
+            if root_account is not None:
+                accountdict[root_account.guid] = root_account
+        if commoditydict is None:
+            commoditydict = {(c.space, c.symbol): c for c in self.commodities}
+        self._accountdict = accountdict
+        self._commoditydict = commoditydict
+        self._transactiondict = {trn.guid: trn for trn in self.transactions}
+        self._splitdict = {spl.guid: spl
+                           for trn in self.transactions
+                           for spl in trn.splits}
+        self._pricedict = {price.guid: price for price in self.prices or ()}
+        if root_account is not None:
+            root_account._account_index()
+        for account in accountdict.values():
+            account.splits.sort(key=_split_date)
+        self._priceindex = None
+        self._fingerprints = None
+        self.stats = None
 
     def __repr__(self):
         return "<Book {}>".format(self.guid)
 
+    @property
+    def tree(self):
+        return self._tree
+
+    @tree.setter
+    def tree(self, tree):
+        if tree is None and self._tree is not None:
+            for account in self._accountdict.values():
+                _decoded(account)
+            for trn in self.transactions:
+                _decoded(trn)
+                for spl in trn.splits:
+                    _decoded(spl)
+        self._tree = tree
+
     def walk(self):
         return self.root_account.walk()
 
     def find_account(self, name):
-        for account, children, splits in self.walk():
-            if account.name == name:
-                return account
+        return self.root_account.find_account(name)
+
+    def find_accounts(self, name):
+        return self.root_account.find_accounts(name)
+
+    def iter_transactions(self, account=None, start=None, end=None,
+                          predicate=None):
+        """Generate the transactions of this book that pass the filters.
+
+        See iterparse_transactions() for the meaning of the filters.
+        """
+        if account is not None and not isinstance(account, Account):
+            account = self.find_account(account)
+            if account is None:
+                return
+        accepts = _transaction_filter(account, start, end, predicate)
+        for transaction in self.transactions:
+            if accepts(transaction):
+                yield transaction
 
     def find_guid(self, guid):
-        for item in self.accounts + self.transactions:
-            if item.guid == guid:
+        for index in (self._accountdict, self._transactiondict,
+                      self._splitdict, self._pricedict):
+            item = index.get(guid)
+            if item is not None:
                 return item
 
+    def get_account(self, guid):
+        return self._accountdict.get(guid)
+
+    def get_transaction(self, guid):
+        return self._transactiondict.get(guid)
+
+    def get_split(self, guid):
+        return self._splitdict.get(guid)
+
+    def get_commodity(self, space, symbol):
+        return self._commoditydict.get((space, symbol))
+
+    def get_price(self, commodity, currency, date=None, exact=False):
+        """
+        Return the Price of commodity in currency at the given date.
+
+        This is the latest price on or before the given day (for a
+        datetime.date) or moment (for a datetime), or the latest price
+        at all if date is None. With exact=True, only a price on that
+        very day or moment is returned. Returns None if there is no
+        such price.
+        """
+        prices = self._price_index().get((commodity, currency))
+        if prices is None:
+            return None
+        dates, days, prices = prices
+        if date is None:
+            return prices[-1]
+        keys = dates if isinstance(date, datetime.datetime) else days
+        i = bisect.bisect_right(keys, date)
+        if i == 0 or (exact and keys[i - 1] != date):
+            return None
+        return prices[i - 1]
+
+    def get_latest_price(self, commodity, currency):
+        return self.get_price(commodity, currency)
+
+    def get_rate(self, commodity, currency, date=None, base=None):
+        """
+        Return the value of one unit of commodity in currency at date.
+
+        Like get_price(), but a price of currency in commodity is used
+        inverted if it is more recent. If there is neither and a base
+        commodity is given, the rate is triangulated through it, e.g.
+        CHF in USD through EUR. Returns None if no rate is known.
+        """
+        if commodity is currency:
+            return 1
+        price = self.get_price(commodity, currency, date)
+        inverse = self.get_price(currency, commodity, date)
+        if inverse is not None and (price is None or inverse.date > price.date):
+            return 1 / inverse.value
+        if price is not None:
+            return price.value
+        if base is not None and base is not commodity and base is not currency:
+            first = self.get_rate(commodity, base, date)
+            second = self.get_rate(base, currency, date)
+            if first is not None and second is not None:
+                return first * second
+        return None
+
+    def _price_index(self):
+        # For each (commodity, currency): dates, days and prices sorted
+        # by date
+        if self._priceindex is None or self._priceindex[0] != len(self.prices or ()):
+            index = {}
+            for price in sorted(self.prices or (), key=_price_date):
+                entry = index.get((price.commodity, price.currency))
+                if entry is None:
+                    entry = index[(price.commodity, price.currency)] = ([], [], [])
+                entry[0].append(price.date)
+                entry[1].append(price.date.date())
+                entry[2].append(price)
+            self._priceindex = (len(self.prices or ()), index)
+        return self._priceindex[1]
+
     def ledger(self):
-        outp = []
+        fobj = io.StringIO()
+        self.write_ledger(fobj)
+        return fobj.getvalue()[:-1]
+
+    def write_ledger(self, fobj):
+        """
+        Write this book in ledger-cli format to the text file object fobj.
+
+        The output is written transaction by transaction, in order of
+        posting date. See write_ledger() to export a file without
+        loading it into a Book first.
+        """
+        fobj.write(_ledger_header(self.commodities, self.accounts))
+        accounts = _LedgerAccounts()
+        _write_batched(fobj, (_ledger_entry(trn, accounts)
+                              for trn in _by_date(self.transactions, _transaction_date)))
+
+    def to_sqlite(self, path):
+        """
+        Write this book to a new SQLite database at path.
+
+        See write_sqlite() for the schema, and to export a file without
+        loading it into a Book first.
+        """
+        _write_sqlite(path, self, self.transactions)
+
+    def to_arrays(self, as_float=False):
+        """
+        Return the splits of this book as a dict of NumPy arrays.
+
+        There is one row per split, in the order of self.transactions:
+
+        - date: posting date, datetime64[s] in UTC
+        - value_num, value_denom, quantity_num, quantity_denom: int64
+          numerator and denominator of value and quantity, or value and
+          quantity as float64 if as_float is true
+        - account: index into self.accounts (-1 for the root account)
+        - transaction: index into self.transactions
+        - reconciled: index into RECONCILED_STATES
+        - memo, description: strings, interned so repeated ones share
+          one object
+
+        Decimal amounts of fractions without a power of ten denominator,
+        such as "100/3", have no int64 numerator and denominator, and
+        raise ValueError unless as_float is true. Load the book with
+        exact=True to keep the fractions of the file.
+
+        This needs the loaded book alongside the arrays; to_arrays() of a
+        file builds them while the file is parsed instead.
+
+        Requires NumPy.
+        """
+        return _split_arrays(self.transactions, self.accounts, as_float)
+
+    def to_dataframe(self, as_float=True):
+        """
+        Return the splits of this book as a pandas DataFrame.
+
+        The columns are those of to_arrays(), except that account and
+        reconciled are categoricals of account full names and reconciled
+        states.
+
+        Requires pandas.
+        """
+        return _split_dataframe(self.to_arrays(as_float=as_float), self.accounts)
+
+    def refresh(self, filename, exact=False):
+        """
+        Bring this book up to date with a newer save of the same file.
+
+        Accounts, prices and transactions are compared by GUID and by a
+        hash of their XML, and only added and changed ones are parsed.
+        Account objects are updated in place, so references to them stay
+        valid; changed prices and transactions are replaced by new
+        objects. Account.splits is patched in place. Commodities and the
+        book slots are reloaded, and changed commodities replaced in
+        accounts, transactions and prices. Load filters are not applied,
+        and Book.tree is set to None.
+
+        Returns a dict mapping 'accounts', 'prices' and 'transactions' to
+        dicts of 'added', 'changed' and 'removed' GUID lists.
+
+        The hashes are those of the previous refresh, or of parse() with
+        fingerprints=True, which the cache of from_filename() keeps as
+        well; without them, every element is re-parsed once and reported
+        as changed.
+        """
+        with _open_book(filename) as fobj:
+            data = fobj.read()
+        return _refresh_book(self, data,
+                             _parse_fraction if exact else _parse_number)
+
+
+class _EmptySlots(collections.abc.Mapping):
+    """Read-only empty slot frame, which pickles as the module singleton."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __repr__(self):
+        return '{}'
+
+    def __reduce__(self):
+        return '_EMPTY_SLOTS'
+
+
+# Slot frames are empty for most objects, so they all share this one
+# instead of having a dict each
+_EMPTY_SLOTS = _EmptySlots()
 
-        for comm in self.commodities:
-            outp.append('commodity {}'.format(comm.name))
-            outp.append('\tnamespace {}'.format(comm.space))
-            outp.append('')
 
-        for account in self.accounts:
-            outp.append('account {}'.format(account.fullname()))
-            if account.description:
-                outp.append('\tnote {}'.format(account.description))
-            outp.append('\tcheck commodity == "{}"'.format(account.commodity))
-            outp.append('')
+class _LazySlots(object):
+    """Undecoded slot frame, the XML element it is read from.
 
-        for trn in sorted(self.transactions):
-            outp.append('{:%Y/%m/%d} * {}'.format(trn.date, trn.description))
-            for spl in trn.splits:
-                outp.append('\t{:50} {:12.2f} {} {}'.format(spl.account.fullname(),
-                                                            spl.value,
-                                                            spl.account.commodity,
-                                                            '; ' + spl.memo if spl.memo else ''))
-            outp.append('')
+    The slots properties of accounts, transactions and splits decode it
+    on first access and keep the result. Pickling decodes it too.
+    """
+
+    __slots__ = ('tree',)
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def decode(self):
+        return _slots_from_tree(self.tree)
+
+    def __reduce__(self):
+        slots = self.decode()
+        if slots is _EMPTY_SLOTS:
+            return '_EMPTY_SLOTS'
+        return dict, (), None, None, iter(slots.items())
+
+
+def _lazy_slots(tree):
+    """Return the slot frame element tree, to be decoded on first access."""
+    if tree is None or not len(tree):
+        return _EMPTY_SLOTS
+    return _LazySlots(tree)
+
+
+def _decoded(obj):
+    """Return the slots of obj, decoding them if that is still to do."""
+    slots = obj._slots
+    if slots.__class__ is _LazySlots:
+        slots = obj._slots = slots.decode()
+    return slots
 
-        return '\n'.join(outp)
+
+# GNU Cash reconciled states: not reconciled, cleared, reconciled,
+# frozen and void
+RECONCILED_STATES = ('n', 'c', 'y', 'f', 'v')
 
 
 class Commodity(object):
@@ -99,8 +415,13 @@ class Commodity(object):
     A commodity is something that's stored in GNU Cash accounts.
 
     Consists of a name (or id) and a space (namespace).
+
+    Commodities read from files are shared by all books loaded in the
+    process, and should not be modified.
     """
 
+    __slots__ = ('space', 'symbol', 'name', 'xcode', '__weakref__')
+
     def __init__(self, space, symbol, name=None, xcode=None):
         self.space = space
         self.symbol = symbol
@@ -108,40 +429,121 @@ class Commodity(object):
         self.xcode = xcode
 
     def __str__(self):
-        return self.name
+        # Currencies have no name in the file
+        return self.name or self.symbol
 
     def __repr__(self):
         return "<Commodity {}:{}>".format(self.space, self.name)
 
+    def __reduce__(self):
+        return _shared_commodity, (self.space, self.symbol, self.name, self.xcode)
+
+
+# Most books hold the same few currencies and securities, so commodities
+# are interned by all their fields: books agreeing on (space, symbol)
+# but not on the name keep their own.
+_commodities = weakref.WeakValueDictionary()
+_commodities_lock = threading.Lock()
+
+
+def _shared_commodity(space, symbol, name=None, xcode=None):
+    """Return the commodity with these fields, shared by all books."""
+    key = (space, symbol, name, xcode)
+    with _commodities_lock:
+        commodity = _commodities.get(key)
+        if commodity is None:
+            commodity = _commodities[key] = Commodity(sys.intern(space),
+                                                      sys.intern(symbol),
+                                                      name, xcode)
+    return commodity
+
 
 class Account(object):
     """
     An account is part of a tree structure of accounts and contains splits.
+
+    The root of a tree keeps an index of its accounts by name and full
+    name, and every account caches its full name. Setting name or parent
+    of an account invalidates the index and the full names of the
+    account and its subaccounts; they are rebuilt on the next lookup.
+
+    Splits are kept sorted by the posting date of their transaction.
+    Running balances over them are computed on the first balance query,
+    and again whenever the number of splits has changed.
     """
 
+    __slots__ = ('_name', '_parent', '_index', '_fullname', 'guid', 'actype',
+                 'description', 'children', 'commodity', 'commodity_scu',
+                 'splits', '_slots', '_dates', '_balances')
+
     def __init__(self, name, guid, actype, parent=None,
                  commodity=None, commodity_scu=None,
                  description=None, slots=None):
-        self.name = name
+        self._name = name
+        self._parent = parent
+        self._index = None
+        self._fullname = None
         self.guid = guid
         self.actype = actype
         self.description = description
-        self.parent = parent
         self.children = []
         self.commodity = commodity
         self.commodity_scu = commodity_scu
         self.splits = []
-        self.slots = slots or {}
+        self._slots = slots or _EMPTY_SLOTS
+        self._dates = None
+        self._balances = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        self._root()._index = None
+        self._forget_fullnames()
+
+    @property
+    def slots(self):
+        return _decoded(self)
+
+    @slots.setter
+    def slots(self, slots):
+        self._slots = slots
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @parent.setter
+    def parent(self, parent):
+        self._root()._index = None
+        self._parent = parent
+        self._root()._index = None
+        self._forget_fullnames()
+
+    def _root(self):
+        account = self
+        while account._parent is not None:
+            account = account._parent
+        return account
+
+    def _forget_fullnames(self):
+        for account, children, splits in self.walk():
+            account._fullname = None
 
     def fullname(self):
-        if self.parent:
-            pfn = self.parent.fullname()
-            if pfn:
-                return '{}:{}'.format(pfn, self.name)
+        if self._fullname is None:
+            if self.parent:
+                pfn = self.parent.fullname()
+                if pfn:
+                    self._fullname = '{}:{}'.format(pfn, self.name)
+                else:
+                    self._fullname = self.name
             else:
-                return self.name
-        else:
-            return ''
+                self._fullname = ''
+        return self._fullname
 
     def __repr__(self):
         return "<Account '{}[{}]' {}...>".format(self.name, self.commodity, self.guid[:10])
@@ -155,30 +557,157 @@ class Account(object):
         You can modify the list of subaccounts, but should not modify
         the list of splits.
         """
-        accounts = [self]
+        accounts = collections.deque([self])
         while accounts:
-            acc, accounts = accounts[0], accounts[1:]
+            acc = accounts.popleft()
             children = list(acc.children)
             yield (acc, children, acc.splits)
             accounts.extend(children)
 
     def find_account(self, name):
-        for account, children, splits in self.walk():
-            if account.name == name:
-                return account
+        """
+        Return the first account in this tree with the given name or
+        colon separated full name, in walk() order, or None.
+        """
+        accounts = self.find_accounts(name)
+        if accounts:
+            return accounts[0]
+
+    def find_accounts(self, name):
+        """
+        Return all accounts in this tree with the given name or colon
+        separated full name, in walk() order.
+        """
+        accounts = self._account_index().get(name, [])
+        if self._parent is None:
+            return list(accounts)
+        return [account for account in accounts if self._contains(account)]
+
+    def _contains(self, account):
+        while account is not None:
+            if account is self:
+                return True
+            account = account._parent
+        return False
+
+    def _account_index(self):
+        root = self._root()
+        if root._index is None:
+            index = {}
+            # Top-down, so that every fullname() call finds the full
+            # name of the parent already cached
+            for account, children, splits in root.walk():
+                fullname = account.fullname()
+                index.setdefault(account.name, []).append(account)
+                if fullname and fullname != account.name:
+                    index.setdefault(fullname, []).append(account)
+            root._index = index
+        return root._index
+
+    def balance_at(self, date, value=False):
+        """
+        Return the balance of this account at the end of the given day
+        (for a datetime.date) or at the given moment (for a datetime).
+
+        This is the sum of split quantities, in the commodity of the
+        account, or of split values, in the currency of each
+        transaction, if value is true.
+        """
+        dates, days, values, quantities = self._balance_table()
+        sums = values if value else quantities
+        return sums[self._count_until(date)]
+
+    def balance_between(self, start, end, value=False):
+        """
+        Return the change of balance from start to end, both inclusive.
+
+        See balance_at() for the arguments.
+        """
+        dates, days, values, quantities = self._balance_table()
+        sums = values if value else quantities
+        keys = dates if isinstance(start, datetime.datetime) else days
+        return sums[self._count_until(end)] - sums[bisect.bisect_left(keys, start)]
+
+    def total_balance_at(self, date, value=False):
+        """
+        Return the balance of this account and all its subaccounts.
+
+        See balance_at() for the arguments.
+        """
+        return sum(account.balance_at(date, value)
+                   for account, children, splits in self.walk())
+
+    def _count_until(self, date):
+        dates, days, values, quantities = self._balance_table()
+        keys = dates if isinstance(date, datetime.datetime) else days
+        return bisect.bisect_right(keys, date)
+
+    def _date_keys(self):
+        # Posting dates and days of the splits, which are sorted again
+        # first if the number of splits has changed
+        if self._dates is None or len(self._dates[0]) != len(self.splits):
+            self.splits.sort(key=_split_date)
+            dates = [split.transaction.date for split in self.splits]
+            self._dates = (dates, [date.date() for date in dates])
+        return self._dates
+
+    def _balance_table(self):
+        # Posting dates and days, and prefix sums of split values and
+        # quantities: sums[i] is the total of the first i splits.
+        if self._balances is None or len(self._balances[0]) != len(self.splits):
+            dates, days = self._date_keys()
+            values = list(itertools.accumulate(
+                (split.value for split in self.splits), initial=0))
+            quantities = list(itertools.accumulate(
+                (split.quantity for split in self.splits), initial=0))
+            self._balances = (dates, days, values, quantities)
+        return self._balances
 
     def get_all_splits(self):
+        """
+        Return the splits of this account and all its subaccounts,
+        sorted by posting date.
+        """
         split_list = []
         for account, children, splits in self.walk():
             split_list.extend(splits)
-        return sorted(split_list)
+        # The splits of every account are sorted already, and sort()
+        # merges such runs faster than heapq.merge() would
+        split_list.sort(key=_split_date)
+        return split_list
+
+    def iter_all_splits(self, start=None, end=None):
+        """
+        Generate the splits of this account and all its subaccounts in
+        order of posting date.
+
+        start and end are inclusive bounds on the posting date, as in
+        balance_between(), or None for no bound. The splits of every
+        account are narrowed down to them by bisection, and merged as
+        they are consumed.
+        """
+        runs = []
+        for account, children, splits in self.walk():
+            dates, days = account._date_keys()
+            low = 0
+            high = len(splits)
+            if start is not None:
+                keys = dates if isinstance(start, datetime.datetime) else days
+                low = bisect.bisect_left(keys, start)
+            if end is not None:
+                keys = dates if isinstance(end, datetime.datetime) else days
+                high = bisect.bisect_right(keys, end)
+            if low < high:
+                # Indexed rather than islice(), which would step over
+                # the splits before low
+                runs.append(map(splits.__getitem__, range(low, high)))
+        yield from heapq.merge(*runs, key=_split_date)
 
     def __lt__(self, other):
         # For sorted() only
         if isinstance(other, Account):
             return self.fullname() < other.fullname()
-        else:
-            False
+        return NotImplemented
 
 
 class Transaction(object):
@@ -186,6 +715,9 @@ class Transaction(object):
     A transaction is a balanced group of splits.
     """
 
+    __slots__ = ('guid', 'currency', 'date', 'date_entered', 'description',
+                 'num', 'splits', '_slots')
+
     def __init__(self, guid=None, currency=None,
                  date=None, date_entered=None,
                  description=None, splits=None,
@@ -193,12 +725,28 @@ class Transaction(object):
         self.guid = guid
         self.currency = currency
         self.date = date
-        self.post_date = date  # for compatibility with piecash
         self.date_entered = date_entered
         self.description = description
         self.num = num or None
         self.splits = splits or []
-        self.slots = slots or {}
+        self._slots = slots or _EMPTY_SLOTS
+
+    @property
+    def slots(self):
+        return _decoded(self)
+
+    @slots.setter
+    def slots(self, slots):
+        self._slots = slots
+
+    # for compatibility with piecash
+    @property
+    def post_date(self):
+        return self.date
+
+    @post_date.setter
+    def post_date(self, date):
+        self.date = date
 
     def __repr__(self):
         return "<Transaction on {} '{}' {}...>".format(
@@ -208,8 +756,7 @@ class Transaction(object):
         # For sorted() only
         if isinstance(other, Transaction):
             return self.date < other.date
-        else:
-            False
+        return NotImplemented
 
 
 class Split(object):
@@ -217,6 +764,10 @@ class Split(object):
     A split is one entry in a transaction.
     """
 
+    __slots__ = ('guid', 'reconciled_state', 'reconcile_date', 'value',
+                 'quantity', 'account', 'transaction', 'action', 'memo',
+                 '_slots')
+
     def __init__(self, guid=None, memo=None,
                  reconciled_state=None, reconcile_date=None, value=None,
                  quantity=None, account=None, transaction=None, action=None,
@@ -230,7 +781,15 @@ class Split(object):
         self.transaction = transaction
         self.action = action
         self.memo = memo
-        self.slots = slots
+        self._slots = slots or _EMPTY_SLOTS
+
+    @property
+    def slots(self):
+        return _decoded(self)
+
+    @slots.setter
+    def slots(self, slots):
+        self._slots = slots
 
     def __repr__(self):
         return "<Split {} '{}' {} {} {}...>".format(self.transaction.date,
@@ -242,9 +801,8 @@ class Split(object):
     def __lt__(self, other):
         # For sorted() only
         if isinstance(other, Split):
-            return self.transaction < other.transaction
-        else:
-            False
+            return self.transaction.date < other.transaction.date
+        return NotImplemented
 
 
 class Price(object):
@@ -253,6 +811,8 @@ class Price(object):
     Consists of date, currency, commodity,  value
     """
 
+    __slots__ = ('guid', 'commodity', 'currency', 'date', 'value')
+
     def __init__(self, guid=None, commodity=None, currency=None,
                  date=None, value=None):
         self.guid = guid
@@ -272,21 +832,1080 @@ class Price(object):
         # For sorted() only
         if isinstance(other, Price):
             return self.date < other.date
+        return NotImplemented
+
+
+def _split_date(split):
+    return split.transaction.date
+
+
+def _price_date(price):
+    return price.date
+
+
+def _transaction_date(transaction):
+    return transaction.date
+
+
+def _by_date(items, date):
+    """Generate items in order of date(item), bucketed by UTC day.
+
+    Items of the same moment keep their order, as with sorted().
+    """
+    days = collections.defaultdict(list)
+    for item in items:
+        days[date(item).timestamp() // 86400].append(item)
+    for day in sorted(days):
+        bucket = days[day]
+        if len(bucket) > 1:
+            bucket.sort(key=date)
+        yield from bucket
+
+
+##################################################################
+# ledger-cli export
+
+def write_ledger(filename, fobj):
+    """Export a GNU Cash file in ledger-cli format to the text file fobj.
+
+    Unlike Book.write_ledger(), the transactions are converted to text
+    as they are parsed, so only the output is held in memory while the
+    transactions are put in order of posting date.
+    """
+    head = from_filename(filename, include=('accounts',))
+    fobj.write(_ledger_header(head.commodities, head.accounts))
+    accounts = _LedgerAccounts()
+    entries = ((trn.date, _ledger_entry(trn, accounts))
+               for trn in iter_transactions(filename))
+    _write_batched(fobj, (entry for date, entry in _by_date(entries, _first)))
+
+
+def ledger_main(argv=None):
+    """Command line entry point of gnucashxml-ledger."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="gnucashxml-ledger",
+        description="Export a GNU Cash XML file in ledger-cli format.")
+    parser.add_argument("filename")
+    parser.add_argument("-o", "--output", default="-",
+                        help="output file, standard output by default")
+    parser.add_argument("--lazy", action="store_true",
+                        help="convert transactions as they are parsed "
+                        "instead of loading the book first")
+    args = parser.parse_args(argv)
+
+    if args.output == "-":
+        fobj = sys.stdout
+    else:
+        fobj = open(args.output, "w", encoding="utf-8", buffering=2**20)
+    try:
+        if args.lazy:
+            write_ledger(args.filename, fobj)
         else:
-            False
+            from_filename(args.filename, streaming=True).write_ledger(fobj)
+    finally:
+        if fobj is not sys.stdout:
+            fobj.close()
+
+
+def _first(pair):
+    return pair[0]
+
+
+def _ledger_header(commodities, accounts):
+    outp = []
+
+    for comm in commodities:
+        outp.append('commodity {}\n'.format(comm.name))
+        outp.append('\tnamespace {}\n\n'.format(comm.space))
+
+    for account in accounts:
+        outp.append('account {}\n'.format(account.fullname()))
+        if account.description:
+            outp.append('\tnote {}\n'.format(account.description))
+        outp.append('\tcheck commodity == "{}"\n\n'.format(account.commodity))
+
+    return ''.join(outp)
+
+
+class _LedgerAccounts(dict):
+    """Posting line prefix and suffix of every account, made on first use."""
+
+    def __missing__(self, account):
+        formats = ('\t{:50} '.format(account.fullname()),
+                   ' {} '.format(account.commodity))
+        self[account] = formats
+        return formats
+
+
+def _ledger_entry(trn, accounts):
+    outp = ['{:%Y/%m/%d} * {}\n'.format(trn.date, trn.description)]
+    for spl in trn.splits:
+        prefix, suffix = accounts[spl.account]
+        outp.append(prefix)
+        outp.append(format(_decimal(spl.value), '12.2f'))
+        outp.append(suffix)
+        if spl.memo:
+            outp.append('; ' + spl.memo)
+        outp.append('\n')
+    outp.append('\n')
+    return ''.join(outp)
+
+
+def _write_batched(fobj, entries, size=1000):
+    """Write strings to fobj, joined in batches of size."""
+    while True:
+        batch = ''.join(itertools.islice(entries, size))
+        if not batch:
+            return
+        fobj.write(batch)
 
 
 ##################################################################
-# XML file parsing
+# Multicolumn report
+
+def multicolumn_matrix(book, account, start=None, end=None):
+    """Tabulate the transactions of an account by counter account.
+
+    account is an Account or an account name or full name. Every
+    transaction with a split in account and a posting day between start
+    and end (inclusive, None for no bound) is a row, and every account
+    it touches, the account itself included, is a column.
+
+    Returns (columns, rows, totals): the accounts in order of first
+    appearance, a list of (transaction, {column: value}) in order of
+    posting date, and the column totals.
+    """
+    if not isinstance(account, Account):
+        name = account
+        account = book.find_account(name)
+        if account is None:
+            raise ValueError("Cannot find account {}".format(name))
+
+    columns = {}
+    rows = []
+    totals = []
+    seen = set()
+    for split in account.splits:
+        transaction = split.transaction
+        # Splits are sorted by posting time, which is not the order of
+        # their days if the UTC offsets differ
+        day = transaction.date.date()
+        if (start is not None and day < start) or (end is not None and day > end):
+            continue
+        if transaction in seen:
+            continue
+        seen.add(transaction)
+        row = {}
+        for other in transaction.splits:
+            column = columns.get(other.account)
+            if column is None:
+                column = columns[other.account] = len(totals)
+                totals.append(0)
+            row[column] = row.get(column, 0) + other.value
+            totals[column] += other.value
+        rows.append((transaction, row))
+    return list(columns), rows, totals
+
+
+def write_multicolumn(fobj, columns, rows, totals):
+    """Write a multicolumn_matrix() result as CSV to the text file fobj."""
+    import csv
+
+    writer = csv.writer(fobj)
+    writer.writerow(["Date"] + [account.fullname() for account in columns] +
+                    ["Description"])
+    indexes = range(len(columns))
+    writer.writerows([transaction.date.date()] +
+                     [row.get(i, 0) for i in indexes] +
+                     [transaction.description]
+                     for transaction, row in rows)
+    writer.writerow([""] + totals + ["Total"])
+
+
+def multicolumn_main(argv=None):
+    """Command line entry point of gnucashxml-multicolumn."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="gnucashxml-multicolumn",
+        description="Write the transactions of an account by counter "
+        "account as CSV.")
+    parser.add_argument("filename")
+    parser.add_argument("account", help="account name or full name")
+    parser.add_argument("--start", type=datetime.date.fromisoformat,
+                        help="first posting day, YYYY-MM-DD")
+    parser.add_argument("--end", type=datetime.date.fromisoformat,
+                        help="last posting day, YYYY-MM-DD")
+    parser.add_argument("-o", "--output", default="-",
+                        help="CSV file, standard output by default")
+    args = parser.parse_args(argv)
+
+    # Only the transactions of the report are loaded
+    book = from_filename(args.filename, streaming=True, since=args.start,
+                         until=args.end, accounts=args.account)
+    report = multicolumn_matrix(book, args.account, args.start, args.end)
+    if args.output == "-":
+        write_multicolumn(sys.stdout, *report)
+    else:
+        with open(args.output, "w", encoding="utf-8", newline="") as fobj:
+            write_multicolumn(fobj, *report)
+
 
-def from_filename(filename):
-    """Parse a GNU Cash file and return a Book object."""
+##################################################################
+# SQLite export
+
+# Dates are UTC, "YYYY-MM-DD HH:MM:SS". Amounts are the numerator and
+# denominator in lowest terms, and the decimal number as text. Splits
+# repeat the posting date of their transaction for the (account, date)
+# index. Slots are flattened to one row per value, keyed by the GUID of
+# their owner and the "/" separated path of the value in its frame.
+_SQLITE_SCHEMA = """
+CREATE TABLE commodities (
+    id INTEGER PRIMARY KEY,
+    space TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    name TEXT,
+    xcode TEXT,
+    UNIQUE (space, symbol)
+);
+CREATE TABLE accounts (
+    id INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL,
+    name TEXT,
+    fullname TEXT,
+    actype TEXT,
+    description TEXT,
+    parent_id INTEGER REFERENCES accounts,
+    commodity_id INTEGER REFERENCES commodities,
+    commodity_scu INTEGER
+);
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL,
+    currency_id INTEGER REFERENCES commodities,
+    date TEXT,
+    date_entered TEXT,
+    description TEXT,
+    num TEXT
+);
+CREATE TABLE splits (
+    id INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL,
+    transaction_id INTEGER NOT NULL REFERENCES transactions,
+    account_id INTEGER NOT NULL REFERENCES accounts,
+    date TEXT,
+    memo TEXT,
+    action TEXT,
+    reconciled_state TEXT,
+    reconcile_date TEXT,
+    value_num INTEGER,
+    value_denom INTEGER,
+    value TEXT,
+    quantity_num INTEGER,
+    quantity_denom INTEGER,
+    quantity TEXT
+);
+CREATE TABLE prices (
+    id INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL,
+    commodity_id INTEGER REFERENCES commodities,
+    currency_id INTEGER REFERENCES commodities,
+    date TEXT,
+    value_num INTEGER,
+    value_denom INTEGER,
+    value TEXT
+);
+CREATE TABLE slots (
+    guid TEXT NOT NULL,
+    path TEXT NOT NULL,
+    value
+);
+"""
+
+# Built after loading, which is faster than updating them on every insert
+_SQLITE_INDEXES = """
+CREATE UNIQUE INDEX accounts_guid ON accounts (guid);
+CREATE UNIQUE INDEX transactions_guid ON transactions (guid);
+CREATE INDEX transactions_date ON transactions (date);
+CREATE UNIQUE INDEX splits_guid ON splits (guid);
+CREATE INDEX splits_account_date ON splits (account_id, date);
+CREATE INDEX splits_transaction ON splits (transaction_id);
+CREATE UNIQUE INDEX prices_guid ON prices (guid);
+CREATE INDEX slots_guid ON slots (guid);
+"""
+
+
+def write_sqlite(filename, path):
+    """Export a GNU Cash file to a new SQLite database at path.
+
+    Unlike Book.to_sqlite(), the transactions are inserted as they are
+    parsed, so memory use does not grow with the number of transactions.
+
+    The tables are commodities, accounts, transactions, splits, prices
+    and slots, with an integer id as primary key and references by id.
+    GUIDs, transaction dates and splits by account and date are indexed.
+
+    Amounts are stored as numerator and denominator in lowest terms, and
+    as decimal text. These are the fractions of the file; Book.to_sqlite()
+    of a book loaded without exact=True stores NULL numerator and
+    denominator where the Decimal of an amount has none that fits in 64
+    bits, such as for "100/3".
+    """
+    head = from_filename(filename, streaming=True, include=('accounts', 'prices'),
+                         exact=True)
+    _write_sqlite(path, head, iter_transactions(filename, exact=True))
+
+
+def sqlite_main(argv=None):
+    """Command line entry point of gnucashxml-sqlite."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="gnucashxml-sqlite",
+        description="Export a GNU Cash XML file to an SQLite database.")
+    parser.add_argument("filename")
+    parser.add_argument("database", help="SQLite database file to create")
+    args = parser.parse_args(argv)
+
+    write_sqlite(args.filename, args.database)
+
+
+def _write_sqlite(path, book, transactions, size=10000):
+    """Write book to path, with transactions instead of its own.
+
+    Rows are inserted in batches of about size, all in one SQL
+    transaction.
+    """
+    import sqlite3
+
+    connection = sqlite3.connect(path)
     try:
-        # try opening with gzip decompression
-        return parse(gzip.open(filename, "rb"))
-    except IOError:
-        # try opening without decompression
-        return parse(open(filename, "rb"))
+        connection.executescript(_SQLITE_SCHEMA)
+        with connection:
+            _insert_book(connection, book, transactions, size)
+        connection.executescript(_SQLITE_INDEXES)
+    finally:
+        connection.close()
+
+
+def _insert_book(connection, book, transactions, size):
+    def insert(table, rows):
+        if rows:
+            connection.executemany("INSERT INTO {} VALUES ({})".format(
+                table, ", ".join("?" * len(rows[0]))), rows)
+            rows.clear()
+
+    # Commodities and accounts are keyed by value: the transactions may
+    # come with objects of their own. Currencies found only in the price
+    # database are in the index, not in book.commodities.
+    commodityids = {}
+    rows = []
+    for id_, comm in enumerate(book._commoditydict.values(), 1):
+        commodityids[comm.space, comm.symbol] = id_
+        rows.append((id_, comm.space, comm.symbol, comm.name, comm.xcode))
+    insert('commodities', rows)
+
+    def commodity_id(comm):
+        return None if comm is None else commodityids[comm.space, comm.symbol]
+
+    accounts = list(book.accounts)
+    if book.root_account is not None:
+        accounts.insert(0, book.root_account)
+    accountids = {acc.guid: id_ for id_, acc in enumerate(accounts, 1)}
+    insert('accounts', [
+        (accountids[acc.guid], acc.guid, acc.name, acc.fullname(), acc.actype,
+         acc.description, acc.parent and accountids[acc.parent.guid],
+         commodity_id(acc.commodity),
+         acc.commodity_scu and int(acc.commodity_scu))
+        for acc in accounts])
+
+    insert('prices', [
+        (id_, price.guid, commodity_id(price.commodity),
+         commodity_id(price.currency), _sqlite_date(price.date))
+        + _sqlite_number(price.value)
+        for id_, price in enumerate(book.prices or (), 1)])
+
+    slots = []
+    _slot_rows(slots, book.guid, book.slots)
+    for acc in accounts:
+        _slot_rows(slots, acc.guid, acc.slots)
+    insert('slots', slots)
+
+    trns = []
+    splits = []
+    for id_, trn in enumerate(transactions, 1):
+        date = _sqlite_date(trn.date)
+        trns.append((id_, trn.guid, commodity_id(trn.currency), date,
+                     _sqlite_date(trn.date_entered), trn.description, trn.num))
+        _slot_rows(slots, trn.guid, trn.slots)
+        for spl in trn.splits:
+            splits.append((None, spl.guid, id_, accountids[spl.account.guid], date,
+                           spl.memo, spl.action, spl.reconciled_state,
+                           _sqlite_date(spl.reconcile_date))
+                          + _sqlite_number(spl.value)
+                          + _sqlite_number(spl.quantity))
+            _slot_rows(slots, spl.guid, spl.slots)
+        if len(splits) >= size:
+            insert('transactions', trns)
+            insert('splits', splits)
+            insert('slots', slots)
+    insert('transactions', trns)
+    insert('splits', splits)
+    insert('slots', slots)
+
+
+# Memoized like _parse_date, whose results these are
+@functools.lru_cache(maxsize=65536)
+def _sqlite_date(date):
+    if date is None:
+        return None
+    return date.astimezone(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _sqlite_number(number):
+    """Return numerator, denominator and decimal text of number."""
+    if number is None:
+        return None, None, None
+    ratio = _integer_ratio(number)
+    if ratio is None:
+        # SQLite integers are int64 too
+        return None, None, str(number)
+    num, denom = ratio
+    if not isinstance(number, decimal.Decimal):
+        number = decimal.Decimal(num) / denom
+    return num, denom, str(number)
+
+
+def _slot_rows(rows, guid, slots, prefix=''):
+    """Append a (guid, path, value) row for every value in slots."""
+    if slots is _EMPTY_SLOTS:
+        return
+    for key, value in slots.items():
+        path = prefix + key
+        if isinstance(value, collections.abc.Mapping):
+            _slot_rows(rows, guid, value, path + '/')
+        elif isinstance(value, list):
+            for i, frame in enumerate(value):
+                _slot_rows(rows, guid, frame, '{}/{}/'.format(path, i))
+        elif isinstance(value, decimal.Decimal):
+            rows.append((guid, path, str(value)))
+        elif isinstance(value, datetime.datetime):
+            rows.append((guid, path, _sqlite_date(value)))
+        else:
+            rows.append((guid, path, value))
+
+
+##################################################################
+# Columnar export
+
+def to_arrays(filename, as_float=False):
+    """Read the splits of a GNU Cash file into a dict of NumPy arrays.
+
+    The columns are those of Book.to_arrays(), but they are filled as
+    the file is parsed, and every transaction is dropped once its splits
+    are in, so the object graph of the book is never built. Rows are in
+    the order of the file: transaction is the position of the
+    transaction in the file, and account an index into
+    from_filename(filename).accounts.
+
+    Unless as_float is true, amounts are read as fractions, so the
+    numerators and denominators are those of the file.
+
+    Requires NumPy.
+    """
+    head = from_filename(filename, streaming=True, include=('accounts',))
+    return _split_arrays(iter_transactions(filename, exact=not as_float),
+                         head.accounts, as_float)
+
+
+def to_dataframe(filename, as_float=True):
+    """Read the splits of a GNU Cash file into a pandas DataFrame.
+
+    The columns are those of Book.to_dataframe(), and the rows those of
+    to_arrays().
+
+    Requires pandas.
+    """
+    head = from_filename(filename, streaming=True, include=('accounts',))
+    arrays = _split_arrays(iter_transactions(filename, exact=not as_float),
+                           head.accounts, as_float)
+    return _split_dataframe(arrays, head.accounts)
+
+
+def _split_arrays(transactions, accounts, as_float):
+    """Return the splits of transactions as columns, see Book.to_arrays()."""
+    import numpy
+
+    accountindex = {account.guid: i for i, account in enumerate(accounts)}
+    stateindex = {state: i for i, state in enumerate(RECONCILED_STATES)}
+    number = 'd' if as_float else 'q'
+    dates = array.array('q')
+    transactionindices = array.array('i')
+    accountindices = array.array('i')
+    states = array.array('b')
+    values = array.array(number)
+    quantities = array.array(number)
+    value_denoms = array.array('q')
+    quantity_denoms = array.array('q')
+    memos = []
+    descriptions = []
+    intern = sys.intern
+
+    for i, trn in enumerate(transactions):
+        timestamp = int(trn.date.timestamp())
+        description = intern(trn.description or '')
+        for spl in trn.splits:
+            dates.append(timestamp)
+            transactionindices.append(i)
+            accountindices.append(accountindex.get(spl.account.guid, -1))
+            states.append(stateindex.get(spl.reconciled_state, -1))
+            if as_float:
+                values.append(float(spl.value))
+                quantities.append(float(spl.quantity))
+            else:
+                value = _integer_ratio(spl.value)
+                quantity = _integer_ratio(spl.quantity)
+                if value is None or quantity is None:
+                    raise ValueError(
+                        "Amounts of split {} have no int64 numerator and "
+                        "denominator, load the book with exact=True or use "
+                        "as_float=True".format(spl.guid))
+                values.append(value[0])
+                value_denoms.append(value[1])
+                quantities.append(quantity[0])
+                quantity_denoms.append(quantity[1])
+            memos.append(intern(spl.memo or ''))
+            descriptions.append(description)
+
+    arrays = {
+        'date': numpy.frombuffer(dates, dtype=numpy.int64).astype('datetime64[s]'),
+        'account': numpy.frombuffer(accountindices, dtype=numpy.int32).copy(),
+        'transaction': numpy.frombuffer(transactionindices, dtype=numpy.int32).copy(),
+        'reconciled': numpy.frombuffer(states, dtype=numpy.int8).copy(),
+        'memo': numpy.array(memos, dtype=object),
+        'description': numpy.array(descriptions, dtype=object),
+    }
+    if as_float:
+        arrays['value'] = numpy.frombuffer(values, dtype=numpy.float64).copy()
+        arrays['quantity'] = numpy.frombuffer(quantities, dtype=numpy.float64).copy()
+    else:
+        arrays['value_num'] = numpy.frombuffer(values, dtype=numpy.int64).copy()
+        arrays['value_denom'] = numpy.frombuffer(value_denoms, dtype=numpy.int64).copy()
+        arrays['quantity_num'] = numpy.frombuffer(quantities, dtype=numpy.int64).copy()
+        arrays['quantity_denom'] = numpy.frombuffer(quantity_denoms, dtype=numpy.int64).copy()
+    return arrays
+
+
+def _split_dataframe(arrays, accounts):
+    """Return arrays of _split_arrays() as a DataFrame of categoricals."""
+    import pandas
+
+    arrays['account'] = pandas.Categorical.from_codes(
+        arrays['account'],
+        categories=[account.fullname() for account in accounts])
+    arrays['reconciled'] = pandas.Categorical.from_codes(
+        arrays['reconciled'], categories=RECONCILED_STATES)
+    return pandas.DataFrame(arrays)
+
+
+##################################################################
+# Load statistics
+
+class LoadStats(object):
+    """
+    Timings, object counts and peak memory of loading a book, by phase.
+
+    Pass an instance to parse() or from_filename() as stats. The phases
+    are 'xml' (building the ElementTree, tree loader only), 'book'
+    (book id and slots), 'commodities', 'prices', 'accounts', 'links'
+    (the account tree), 'transactions' (with their splits) and 'index'
+    (Book indexes and sorting). With the streaming loader, reading the
+    XML of an element counts towards its phase. A phase that occurs
+    more than once is summed up.
+
+    seconds and peaks map phases to wall-clock time and to the peak of
+    memory allocated by Python during the phase. Peaks are only
+    recorded with memory=True, which traces allocations with
+    tracemalloc and slows down loading severalfold.
+
+    With detail=True, the load runs under cProfile, and details maps
+    'splits' and 'slots' (building them, slots of splits included in
+    splits), 'dates' and 'numbers' (converting strings not seen before)
+    to seconds, which then include the profiler's overhead. Worker
+    processes of a parallel load are not profiled.
+
+    counts maps kinds of objects to the number loaded. callback, if
+    given, is called with the name and seconds of every phase as it
+    ends.
+    """
+
+    def __init__(self, memory=False, detail=False, callback=None):
+        self.memory = memory
+        self.detail = detail
+        self.callback = callback
+        self.seconds = {}
+        self.peaks = {}
+        self.counts = {}
+        self.details = {}
+        self._phase = None
+        self._start = None
+        self._tracing = False
+        self._profile = None
+
+    def _begin(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if self.detail:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def _enter(self, phase):
+        if phase == self._phase:
+            return
+        now = time.perf_counter()
+        previous = self._phase
+        if previous is not None:
+            seconds = now - self._start
+            self.seconds[previous] = self.seconds.get(previous, 0) + seconds
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.peaks[previous] = max(self.peaks.get(previous, 0), peak)
+            if self.callback is not None:
+                self.callback(previous, seconds)
+        if self.memory:
+            tracemalloc.reset_peak()
+        self._phase = phase
+        self._start = time.perf_counter()
+
+    def _end(self, book):
+        self._enter(None)
+        if self._profile is not None:
+            self._profile.disable()
+            codes = {_split_from_tree.__code__: 'splits',
+                     _slots_from_tree.__code__: 'slots',
+                     _parse_date.__wrapped__.__code__: 'dates',
+                     _parse_number.__wrapped__.__code__: 'numbers',
+                     _parse_fraction.__wrapped__.__code__: 'numbers'}
+            for entry in self._profile.getstats():
+                name = codes.get(entry.code)
+                if name is not None:
+                    self.details[name] = self.details.get(name, 0) + entry.totaltime
+            self._profile = None
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        if book is not None:
+            splits = [split for trn in book.transactions for split in trn.splits]
+            self.counts = {
+                'commodities': len(book.commodities),
+                'prices': len(book.prices or ()),
+                'accounts': len(book.accounts),
+                'transactions': len(book.transactions),
+                'splits': len(splits),
+                # Undecoded frames count without being decoded
+                'slot frames': bool(book.slots) + sum(
+                    1 for obj in itertools.chain(book.accounts,
+                                                 book.transactions, splits)
+                    if obj._slots),
+            }
+
+    def report(self):
+        """Return the statistics as a table for humans."""
+        lines = ['{:14} {:>9} {:>9}'.format('phase', 'seconds',
+                                            'peak MiB' if self.peaks else '')]
+        for phase, seconds in self.seconds.items():
+            peak = self.peaks.get(phase)
+            lines.append('{:14} {:9.3f} {:>9}'.format(
+                phase, seconds, '' if peak is None else '{:.1f}'.format(peak / 2**20)))
+        lines.append('{:14} {:9.3f}'.format('total', sum(self.seconds.values())))
+        if self.details:
+            lines.append('')
+            lines.append('{:14} {:>9}'.format('profiled', 'seconds'))
+            for name, seconds in sorted(self.details.items()):
+                lines.append('{:14} {:9.3f}'.format(name, seconds))
+        if self.counts:
+            lines.append('')
+            for name, count in self.counts.items():
+                lines.append('{:14} {:9}'.format(name, count))
+        return '\n'.join(lines)
+
+
+def profile_main(argv=None):
+    """Command line entry point of gnucashxml-profile."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="gnucashxml-profile",
+        description="Load a GNU Cash XML file and show where the time goes.")
+    parser.add_argument("filename")
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--exact", action="store_true")
+    parser.add_argument("--backend", choices=sorted(_BACKENDS))
+    parser.add_argument("--memory", action="store_true",
+                        help="record peak memory per phase (slow)")
+    parser.add_argument("--detail", action="store_true",
+                        help="profile splits, slots, dates and numbers (slow)")
+    args = parser.parse_args(argv)
+
+    stats = LoadStats(memory=args.memory, detail=args.detail)
+    from_filename(args.filename, streaming=args.streaming, workers=args.workers,
+                  exact=args.exact, backend=args.backend, stats=stats)
+    print(stats.report())
+
+
+##################################################################
+# Concurrent loading
+
+# Loads in progress, by event loop and from_filename() arguments
+_loading = {}
+
+
+async def load_book(filename, executor=None, **kwargs):
+    """Parse a GNU Cash file off the event loop and return a Book object.
+
+    Keyword arguments are passed on to from_filename(), which runs in
+    executor, the default executor of the event loop if None. A process
+    pool is not supported; see load_books() for that.
+
+    Concurrent calls for the same file and arguments share one load and
+    return the same Book.
+    """
+    loop = asyncio.get_running_loop()
+    key = (loop, _load_key(filename, kwargs))
+    future = _loading.get(key)
+    if future is None:
+        future = _loading[key] = loop.run_in_executor(
+            executor, functools.partial(from_filename, filename, **kwargs))
+        future.add_done_callback(lambda future: _loading.pop(key, None))
+    # One caller giving up must not cancel the load for the others
+    return await asyncio.shield(future)
+
+
+def load_books(filenames, max_workers=None, processes=False, **kwargs):
+    """Parse several GNU Cash files concurrently and return their Books.
+
+    Keyword arguments are passed on to from_filename(). The files are
+    parsed in a pool of max_workers threads, or processes if processes
+    is true, and the books returned in the order of filenames. A file
+    given more than once is loaded once, and the same Book returned for
+    every occurrence. Book.tree is None with processes.
+    """
+    keys = [_load_key(filename, kwargs) for filename in filenames]
+    executor = (concurrent.futures.ProcessPoolExecutor if processes
+                else concurrent.futures.ThreadPoolExecutor)
+    futures = {}
+    with executor(max_workers) as pool:
+        for key, filename in zip(keys, filenames):
+            if key in futures:
+                continue
+            if processes:
+                futures[key] = pool.submit(_book_state_from_filename, filename, kwargs)
+            else:
+                futures[key] = pool.submit(from_filename, filename, **kwargs)
+        books = {key: future.result() for key, future in futures.items()}
+    if processes:
+        books = {key: _book_from_state(state) for key, state in books.items()}
+    return [books[key] for key in keys]
+
+
+def _load_key(filename, kwargs):
+    return repr((os.path.abspath(filename), sorted(kwargs.items())))
+
+
+# Worker side of load_books() with processes. Books are linked too
+# deeply to be pickled as they are, so they are flattened as for the
+# cache; commodities are shared again as they are rebuilt.
+def _book_state_from_filename(filename, kwargs):
+    return _book_to_state(from_filename(filename, **kwargs))
+
+
+##################################################################
+# XML file parsing
+
+# Qualified tag names and paths, built once instead of on every lookup
+_GNC = '{http://www.gnucash.org/XML/gnc}'
+_BOOK = '{http://www.gnucash.org/XML/book}'
+_CMDTY = '{http://www.gnucash.org/XML/cmdty}'
+_PRICE = '{http://www.gnucash.org/XML/price}'
+_ACT = '{http://www.gnucash.org/XML/act}'
+_TRN = '{http://www.gnucash.org/XML/trn}'
+_SPLIT = '{http://www.gnucash.org/XML/split}'
+_SLOT = '{http://www.gnucash.org/XML/slot}'
+_TS = '{http://www.gnucash.org/XML/ts}'
+
+_GNC_BOOK = _GNC + 'book'
+_GNC_COMMODITY = _GNC + 'commodity'
+_GNC_PRICEDB = _GNC + 'pricedb'
+_GNC_ACCOUNT = _GNC + 'account'
+_GNC_TRANSACTION = _GNC + 'transaction'
+_BOOK_ID = _BOOK + 'id'
+_BOOK_SLOTS = _BOOK + 'slots'
+_CMDTY_SPACE = _CMDTY + 'space'
+_CMDTY_ID = _CMDTY + 'id'
+_CMDTY_NAME = _CMDTY + 'name'
+_CMDTY_XCODE = _CMDTY + 'xcode'
+_TS_DATE = _TS + 'date'
+_PRICE_ID = _PRICE + 'id'
+_PRICE_COMMODITY = _PRICE + 'commodity'
+_PRICE_CURRENCY = _PRICE + 'currency'
+_PRICE_TIME = _PRICE + 'time'
+_PRICE_VALUE = _PRICE + 'value'
+_ACT_NAME = _ACT + 'name'
+_ACT_ID = _ACT + 'id'
+_ACT_TYPE = _ACT + 'type'
+_ACT_DESCRIPTION = _ACT + 'description'
+_ACT_COMMODITY = _ACT + 'commodity'
+_ACT_COMMODITY_SCU = _ACT + 'commodity-scu'
+_ACT_PARENT = _ACT + 'parent'
+_ACT_SLOTS = _ACT + 'slots'
+_TRN_ID = _TRN + 'id'
+_TRN_CURRENCY = _TRN + 'currency'
+_TRN_DATE_POSTED = _TRN + 'date-posted'
+_TRN_DATE_ENTERED = _TRN + 'date-entered'
+_TRN_DESCRIPTION = _TRN + 'description'
+_TRN_NUM = _TRN + 'num'
+_TRN_SLOTS = _TRN + 'slots'
+_TRN_SPLITS = _TRN + 'splits'
+_TRN_SPLIT = _TRN + 'split'
+_SPLIT_ID = _SPLIT + 'id'
+_SPLIT_MEMO = _SPLIT + 'memo'
+_SPLIT_ACTION = _SPLIT + 'action'
+_SPLIT_RECONCILED_STATE = _SPLIT + 'reconciled-state'
+_SPLIT_RECONCILE_DATE = _SPLIT + 'reconcile-date'
+_SPLIT_VALUE = _SPLIT + 'value'
+_SPLIT_QUANTITY = _SPLIT + 'quantity'
+_SPLIT_ACCOUNT = _SPLIT + 'account'
+_SPLIT_SLOTS = _SPLIT + 'slots'
+_SLOT_KEY = _SLOT + 'key'
+_SLOT_VALUE = _SLOT + 'value'
+
+_TRN_DATE_POSTED_DATE = _TRN_DATE_POSTED + '/' + _TS_DATE
+_TRN_SPLIT_ACCOUNTS = _TRN_SPLITS + '/' + _TRN_SPLIT + '/' + _SPLIT_ACCOUNT
+
+
+def from_filename(filename, cache_dir=None, cache_size=2**30, **kwargs):
+    """Parse a GNU Cash file and return a Book object.
+
+    Keyword arguments are passed on to parse().
+
+    If cache_dir is given, the parsed book is stored there and loaded
+    from there as long as path, size, modification time and content of
+    the file are unchanged. The least recently used entries are removed
+    when the cache grows beyond cache_size bytes. Book.tree is always
+    None with a cache. The cache files are pickles, so cache_dir must
+    not be writable by anybody you do not trust.
+    """
+    if cache_dir is not None:
+        return _from_cache(filename, cache_dir, cache_size, kwargs)
+    with _open_book(filename) as fobj:
+        return parse(fobj, **kwargs)
+
+
+def iter_transactions(filename, account=None, start=None, end=None,
+                      predicate=None, exact=False):
+    """Parse a GNU Cash file and generate its transactions one by one.
+
+    See iterparse_transactions() for the arguments.
+    """
+    with _open_book(filename) as fobj:
+        for transaction in iterparse_transactions(fobj, account, start, end,
+                                                  predicate, exact):
+            yield transaction
+
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _open_book(filename):
+    """Open a GNU Cash file, compressed or not, for binary reading.
+
+    Compressed files are inflated in a background thread if there is
+    more than one CPU. Plain files are memory-mapped.
+    """
+    with open(filename, "rb") as fobj:
+        compressed = fobj.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+        if not compressed:
+            try:
+                return mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files cannot be mapped
+                pass
+    if not compressed:
+        return open(filename, "rb")
+    if (os.cpu_count() or 1) > 1:
+        return _InflatingReader(gzip.open(filename, "rb"))
+    return gzip.open(filename, "rb")
+
+
+class _InflatingReader(io.RawIOBase):
+    """Read-only file which decompresses fobj in a background thread.
+
+    Up to chunks blocks of chunk_size bytes are decompressed ahead of
+    the reader; zlib releases the GIL, so inflating overlaps with
+    parsing.
+    """
+
+    def __init__(self, fobj, chunk_size=2**20, chunks=8):
+        super().__init__()
+        self._fobj = fobj
+        self._queue = queue.Queue(chunks)
+        self._stop = threading.Event()
+        self._block = b''
+        self._offset = 0
+        self._eof = False
+        self._thread = threading.Thread(target=self._inflate, args=(chunk_size,),
+                                        daemon=True)
+        self._thread.start()
+
+    def _inflate(self, chunk_size):
+        try:
+            while True:
+                block = self._fobj.read(chunk_size)
+                if not self._put(block) or not block:
+                    return
+        except BaseException as exc:
+            self._put(exc)
+
+    def _put(self, item):
+        # Give up once the reader has been closed
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _next_block(self):
+        item = self._queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        if not item:
+            self._eof = True
+        self._block = item
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.readall()
+        if self._offset >= len(self._block):
+            if self._eof:
+                return b''
+            self._next_block()
+        data = self._block[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readall(self):
+        blocks = [self._block[self._offset:]]
+        while not self._eof:
+            self._next_block()
+            blocks.append(self._block)
+        self._block = b''
+        self._offset = 0
+        return b''.join(blocks)
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._fobj.close()
+        super().close()
+
+
+def iterparse_transactions(fobj, account=None, start=None, end=None,
+                           predicate=None, exact=False):
+    """Generate the transactions of GNU Cash XML data as they are read.
+
+    The account tree is parsed first and every split's account is
+    resolved against it, but transactions are not added to
+    Account.splits and the XML is discarded as it is consumed, so
+    memory use does not grow with the number of transactions.
+
+    Only transactions matching all given filters are generated:
+    account (an account name or Account) must have a split in the
+    transaction, start and end are inclusive bounds on the posting
+    date, and predicate is called with the transaction.
+
+    With exact=True, split values and quantities are fractions.Fraction
+    instances, as in parse().
+    """
+    parse_number = _parse_fraction if exact else _parse_number
+    commoditydict = {}
+    root_account = None
+    accountdict = {}
+    parentdict = {}
+    accepts = None
+    selected = None
+
+    for elem in _iterparse_book(fobj):
+        tag = elem.tag
+        if tag == _GNC_TRANSACTION:
+            if accepts is None:
+                # The account tree is complete by the first transaction
+                _link_accounts(accountdict, parentdict)
+                if account is not None and not isinstance(account, Account):
+                    account = root_account.find_account(account)
+                    if account is None:
+                        return
+                accepts = _transaction_filter(account, start, end, predicate)
+                selected = _transaction_prefilter(start, end)
+            if selected is not None and not selected(elem):
+                continue
+            transaction = _transaction_from_tree(elem,
+                                                 accountdict,
+                                                 commoditydict,
+                                                 parse_number,
+                                                 link=False)
+            if accepts(transaction):
+                yield transaction
+        elif tag == _GNC_ACCOUNT:
+            parent_guid, acc = _account_from_tree(elem, commoditydict)
+            if acc.actype == 'ROOT':
+                root_account = acc
+            accountdict[acc.guid] = acc
+            parentdict[acc.guid] = parent_guid
+        elif tag == _GNC_COMMODITY:
+            commodity = _commodity_from_tree(elem)
+            commoditydict[(commodity.space, commodity.symbol)] = commodity
+
+
+def _transaction_filter(account=None, start=None, end=None, predicate=None):
+    """Return a function that tells if a transaction passes the filters."""
+    def on_or_after(date, bound):
+        if isinstance(bound, datetime.datetime):
+            return date >= bound
+        return date.date() >= bound
+
+    def on_or_before(date, bound):
+        if isinstance(bound, datetime.datetime):
+            return date <= bound
+        return date.date() <= bound
+
+    def accepts(transaction):
+        if start is not None and not on_or_after(transaction.date, start):
+            return False
+        if end is not None and not on_or_before(transaction.date, end):
+            return False
+        if account is not None and not any(split.account.guid == account.guid
+                                           for split in transaction.splits):
+            return False
+        return predicate is None or predicate(transaction)
+
+    return accepts
 
 
 # Implemented:
@@ -295,17 +1914,170 @@ def from_filename(filename):
 # Not implemented:
 # - gnc:count-data
 #   - This seems to be primarily for integrity checks?
-def parse(fobj):
-    """Parse GNU Cash XML data from a file object and return a Book object."""
+def parse(fobj, streaming=False, keep_tree=False, exact=False, workers=None,
+          include=None, since=None, until=None, accounts=None,
+          fingerprints=False, backend=None, stats=None):
+    """Parse GNU Cash XML data from a file object and return a Book object.
+
+    With streaming=True, the file is read incrementally and every
+    element is discarded as soon as it has been converted, so the full
+    ElementTree is never held in memory. Book.tree is None in that
+    case, unless keep_tree is true.
+
+    With exact=True, split values and quantities and prices are
+    fractions.Fraction instances of the stored numerator and
+    denominator instead of Decimal.
+
+    With workers > 1, the transactions are parsed in that many worker
+    processes. The whole decompressed file is read into memory first,
+    and Book.tree is None.
+
+    The remaining arguments restrict what is loaded; elements that are
+    left out are skipped before any objects are built for them.
+    include is a collection of 'accounts', 'prices' and 'transactions'
+    (commodities are always loaded, and transactions need accounts).
+    since and until are inclusive bounds on the posting date of
+    transactions, as in iterparse_transactions(). accounts is an account
+    name or full name, or a list of them, and restricts transactions to
+    those with a split in the subtree of one of these accounts.
+
+    With fingerprints=True, a hash of every account, price and
+    transaction is kept for Book.refresh(). The whole decompressed file
+    is read into memory first.
+
+    backend is the XML parser, 'lxml' or 'stdlib' (xml.etree). By
+    default, lxml is used if it is installed; otherwise a RuntimeWarning
+    says that parsing falls back to the slower standard library.
+
+    stats is a LoadStats instance to record the load in; it is also
+    set as Book.stats.
+    """
+    if fingerprints:
+        data = fobj.read()
+        book = parse(io.BytesIO(data), streaming, keep_tree, exact, workers,
+                     include, since, until, accounts, backend=backend,
+                     stats=stats)
+        book._fingerprints = _fingerprints(_book_spans(data))
+        return book
+    etree = _backend(backend)
+    selection = _Selection(include, since, until, accounts)
+    if stats is None:
+        return _load_book(fobj, streaming, keep_tree, exact, workers, selection,
+                          backend or BACKEND, etree)
+    book = None
+    stats._begin()
     try:
-        tree = ElementTree.parse(fobj)
-    except ParseError:
+        book = _load_book(fobj, streaming, keep_tree, exact, workers, selection,
+                          backend or BACKEND, etree, stats)
+    finally:
+        stats._end(book)
+    book.stats = stats
+    return book
+
+
+def _load_book(fobj, streaming, keep_tree, exact, workers, selection, backend,
+               etree, stats=None):
+    parse_number = _parse_fraction if exact else _parse_number
+    if workers is not None and workers > 1 and selection.transactions:
+        return _book_from_parallel(fobj, exact, workers, selection, backend,
+                                   stats)
+    if streaming or not selection.transactions:
+        return _book_from_iterparse(fobj, parse_number, selection, keep_tree,
+                                    etree, stats)
+
+    if stats is not None:
+        stats._enter('xml')
+    try:
+        tree = etree.parse(fobj)
+    except _PARSE_ERRORS:
         raise ValueError("File stream was not a valid GNU Cash v2 XML file")
 
     root = tree.getroot()
     if root.tag != 'gnc-v2':
         raise ValueError("File stream was not a valid GNU Cash v2 XML file")
-    return _book_from_tree(root.find("{http://www.gnucash.org/XML/gnc}book"))
+    return _book_from_tree(root.find(_GNC_BOOK), parse_number, selection, stats)
+
+
+def _backend(name=None):
+    """Return the ElementTree module of the named XML backend."""
+    if name is None:
+        if lxml is None:
+            warnings.warn("lxml is not installed, parsing with the slower "
+                          "xml.etree.ElementTree", RuntimeWarning, stacklevel=3)
+        return ElementTree
+    try:
+        return _BACKENDS[name]
+    except KeyError:
+        if name == 'lxml':
+            raise ImportError("The lxml backend needs lxml to be installed")
+        raise ValueError("Unknown XML backend {!r}".format(name))
+
+
+class _Selection(object):
+    """The parts of a book that parse() was asked to load."""
+
+    def __init__(self, include=None, since=None, until=None, accounts=None):
+        kinds = ('accounts', 'prices', 'transactions')
+        include = set(kinds if include is None else include)
+        if not include.issubset(kinds):
+            raise ValueError("Can only include {}, not {}".format(
+                ", ".join(kinds), ", ".join(sorted(include.difference(kinds)))))
+        self.transactions = 'transactions' in include
+        self.accounts = self.transactions or 'accounts' in include
+        self.prices = 'prices' in include
+        self.since = since
+        self.until = until
+        if isinstance(accounts, str):
+            accounts = [accounts]
+        self.account_names = accounts
+
+    def account_guids(self, root_account):
+        """Return the GUIDs of the selected subtrees, or None for all."""
+        if self.account_names is None:
+            return None
+        guids = set()
+        for name in self.account_names:
+            for account in root_account.find_accounts(name):
+                guids.update(acc.guid for acc, children, splits in account.walk())
+        return guids
+
+    def transaction_filter(self, root_account):
+        """Return a function telling if a gnc:transaction is selected."""
+        return _transaction_prefilter(self.since, self.until,
+                                      self.account_guids(root_account))
+
+
+# Like _transaction_filter, but looking at the gnc:transaction element,
+# so that transactions can be dropped before anything is built. Dates
+# are compared as "YYYY-MM-DD" strings, the date part of the posting
+# timestamp in its own offset, like trn.date.date().
+def _transaction_prefilter(since=None, until=None, guids=None):
+    def bound(date):
+        if date is None or isinstance(date, datetime.datetime):
+            return date
+        return date.isoformat()
+
+    since, until = bound(since), bound(until)
+    if since is None and until is None and guids is None:
+        return None
+
+    def selected(tree):
+        if since is not None or until is not None:
+            posted = tree.find(_TRN_DATE_POSTED_DATE).text
+            if since is not None:
+                date = posted[:10] if isinstance(since, str) else _parse_date(posted)
+                if date < since:
+                    return False
+            if until is not None:
+                date = posted[:10] if isinstance(until, str) else _parse_date(posted)
+                if date > until:
+                    return False
+        if guids is not None:
+            return any(account.text in guids
+                       for account in tree.iterfind(_TRN_SPLIT_ACCOUNTS))
+        return True
+
+    return selected
 
 
 # Implemented:
@@ -320,110 +2092,62 @@ def parse(fobj):
 # - gnc:template-transactions
 # - gnc:count-data
 #   - This seems to be primarily for integrity checks?
-def _book_from_tree(tree):
-    guid = tree.find('{http://www.gnucash.org/XML/book}id').text
-
-    # Implemented:
-    # - cmdty:space
-    # - cmdty:id => Symbol
-    # - cmdty:name
-    # - cmdty:xcode => optional, e.g. ISIN/WKN
-    #
-    # Not implemented:
-    # - cmdty:get_quotes => unknown, empty, optional
-    # - cmdty:quote_tz => unknown, empty, optional
-    # - cmdty:source => text, optional, e.g. "currency"
-    # - cmdty:fraction => optional, e.g. "1"
-    def _commodity_from_tree(tree):
-        space = tree.find('{http://www.gnucash.org/XML/cmdty}space').text
-        symbol = tree.find('{http://www.gnucash.org/XML/cmdty}id').text
-        commodity = Commodity(space=space, symbol=symbol)
-        try:
-            commodity.name = tree.find('{http://www.gnucash.org/XML/cmdty}name').text
-        except AttributeError:
-            pass
-
-        try:
-            commodity.xcode = tree.find('{http://www.gnucash.org/XML/cmdty}xcode').text
-        except AttributeError:
-            pass
-
-        return commodity
+def _book_from_tree(tree, parse_number, selection, stats=None):
+    if stats is not None:
+        stats._enter('commodities')
+    guid = tree.find(_BOOK_ID).text
 
     commodities = []  # This will store the Gnucash root list of commodities
-    for child in tree.findall('{http://www.gnucash.org/XML/gnc}commodity'):
+    for child in tree.findall(_GNC_COMMODITY):
         commodity = _commodity_from_tree(child)
         commodities.append(commodity)
 
     # Map unique combination of namespace/symbol to instance of Commodity
     commoditydict = {(c.space, c.symbol): c for c in commodities}
 
-    # Implemented:
-    # - price
-    # - price:guid
-    # - price:commodity
-    # - price:currency
-    # - price:date
-    # - price:value
-    def _price_from_tree(tree):
-        price = '{http://www.gnucash.org/XML/price}'
-        cmdty = '{http://www.gnucash.org/XML/cmdty}'
-        ts = "{http://www.gnucash.org/XML/ts}"
-
-        guid = tree.find(price + 'id').text
-        value = _parse_number(tree.find(price + 'value').text)
-        date = parse_date(tree.find(price + 'time/' + ts + 'date').text)
-
-        currency_space = tree.find(price + "currency/" + cmdty + "space").text
-        currency_id = tree.find(price + "currency/" + cmdty + "id").text
-        # pricedb may contain currencies not part of the commodities root list
-        currency = commoditydict.setdefault((currency_space, currency_id),
-                                            Commodity(space=currency_space, symbol=currency_id))
-
-        commodity_space = tree.find(price + "commodity/" + cmdty + "space").text
-        commodity_id = tree.find(price + "commodity/" + cmdty + "id").text
-        commodity = commoditydict[(commodity_space, commodity_id)]
-
-        return Price(guid=guid,
-                     commodity=commodity,
-                     date=date,
-                     value=value,
-                     currency=currency)
-
+    if stats is not None:
+        stats._enter('prices')
     prices = []
-    t = tree.find('{http://www.gnucash.org/XML/gnc}pricedb')
-    if t is not None:
+    t = tree.find(_GNC_PRICEDB)
+    if t is not None and selection.prices:
         for child in t.findall('price'):
-            price = _price_from_tree(child)
+            price = _price_from_tree(child, commoditydict, parse_number)
             prices.append(price)
 
+    if stats is not None:
+        stats._enter('accounts')
     root_account = None
-    accounts = []
     accountdict = {}
     parentdict = {}
 
-    for child in tree.findall('{http://www.gnucash.org/XML/gnc}account'):
-        parent_guid, acc = _account_from_tree(child, commoditydict)
+    # Book.tree keeps the XML, so slot frames are left to decode on
+    # first access
+    for child in tree.findall(_GNC_ACCOUNT):
+        parent_guid, acc = _account_from_tree(child, commoditydict,
+                                              lazy_slots=True)
         if acc.actype == 'ROOT':
             root_account = acc
         accountdict[acc.guid] = acc
         parentdict[acc.guid] = parent_guid
-    for acc in list(accountdict.values()):
-        if acc.parent is None and acc.actype != 'ROOT':
-            parent = accountdict[parentdict[acc.guid]]
-            acc.parent = parent
-            parent.children.append(acc)
-            accounts.append(acc)
+    if stats is not None:
+        stats._enter('links')
+    accounts = _link_accounts(accountdict, parentdict)
 
+    if stats is not None:
+        stats._enter('transactions')
     transactions = []
-    for child in tree.findall('{http://www.gnucash.org/XML/gnc}'
-                              'transaction'):
-        transactions.append(_transaction_from_tree(child,
-                                                   accountdict,
-                                                   commoditydict))
-
-    slots = _slots_from_tree(
-        tree.find('{http://www.gnucash.org/XML/book}slots'))
+    selected = selection.transaction_filter(root_account)
+    for child in tree.findall(_GNC_TRANSACTION):
+        if selected is None or selected(child):
+            transactions.append(_transaction_from_tree(child,
+                                                       accountdict,
+                                                       commoditydict,
+                                                       parse_number,
+                                                       lazy_slots=True))
+
+    slots = _slots_from_tree(tree.find(_BOOK_SLOTS))
+    if stats is not None:
+        stats._enter('index')
     return Book(tree=tree,
                 guid=guid,
                 prices=prices,
@@ -431,7 +2155,594 @@ def _book_from_tree(tree):
                 root_account=root_account,
                 accounts=accounts,
                 commodities=commodities,
-                slots=slots)
+                slots=slots,
+                accountdict=accountdict,
+                commoditydict=commoditydict)
+
+
+# Yield the elements of interest of a GNU Cash XML stream as soon as
+# their end tag has been read: the gnc:book element itself (on its
+# start tag, so that it comes first), its direct children and the
+# prices in gnc:pricedb. Each element is cleared and detached once the
+# consumer asks for the next one, unless keep_tree is true.
+#
+# Only direct children of gnc:book are yielded, which keeps accounts
+# and transactions of the (not implemented) gnc:template-transactions
+# out of the book.
+def _iterparse_book(fobj, keep_tree=False, etree=ElementTree):
+    if lxml is not None and etree is lxml.etree:
+        yield from _iterparse_book_lxml(fobj, keep_tree)
+        return
+
+    # Ancestors of the element currently being parsed
+    path = []
+    try:
+        for event, elem in etree.iterparse(fobj, events=('start', 'end')):
+            if event == 'start':
+                if not path and elem.tag != 'gnc-v2':
+                    raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+                path.append(elem)
+                if len(path) == 2 and elem.tag == _GNC_BOOK:
+                    yield elem
+                continue
+
+            path.pop()
+            depth = len(path)
+            if depth == 2 and path[1].tag == _GNC_BOOK:
+                yield elem
+            elif depth == 3 and elem.tag == 'price' and path[2].tag == _GNC_PRICEDB:
+                yield elem
+            else:
+                continue
+
+            if not keep_tree:
+                elem.clear()
+                path[-1].remove(elem)
+    except _PARSE_ERRORS:
+        raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+
+
+# lxml can filter the events by tag and knows the parent of every
+# element, so Python only ever sees the elements of interest.
+#
+# The other children of gnc:book (gnc:count-data, gnc:schedxaction,
+# gnc:budget, ...) never show up, so they are removed as the siblings
+# before the next element of interest, or with the rest of the book at
+# its end tag. Accounts and transactions in gnc:template-transactions
+# are removed as they are read, so that the container stays small.
+_BOOK_ELEMENTS = (_GNC_BOOK, _BOOK_ID, _BOOK_SLOTS, _GNC_COMMODITY, _GNC_PRICEDB,
+                  _GNC_ACCOUNT, _GNC_TRANSACTION, 'price')
+
+
+def _iterparse_book_lxml(fobj, keep_tree=False):
+    try:
+        events = lxml.etree.iterparse(fobj, events=('start', 'end'),
+                                      tag=_BOOK_ELEMENTS)
+        for event, elem in events:
+            tag = elem.tag
+            parent = elem.getparent()
+            if event == 'start':
+                if tag == _GNC_BOOK:
+                    if (parent is None or parent.tag != 'gnc-v2' or
+                            parent.getparent() is not None):
+                        raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+                    yield elem
+                continue
+
+            if tag == 'price':
+                selected = parent.tag == _GNC_PRICEDB
+            else:
+                selected = parent is not None and parent.tag == _GNC_BOOK
+            if selected:
+                yield elem
+            if keep_tree:
+                continue
+            if tag == _GNC_BOOK:
+                elem.clear()
+            elif parent is not None:
+                elem.clear()
+                if selected and tag != 'price':
+                    while elem.getprevious() is not None:
+                        del parent[0]
+                parent.remove(elem)
+        # The root is only checked at gnc:book, which other files lack
+        if events.root is None or events.root.tag != 'gnc-v2':
+            raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+    except _PARSE_ERRORS:
+        raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+
+
+# LoadStats phase of each element of _iterparse_book
+_PHASES = {_GNC_COMMODITY: 'commodities',
+           _GNC_PRICEDB: 'prices',
+           'price': 'prices',
+           _GNC_ACCOUNT: 'accounts',
+           _GNC_TRANSACTION: 'transactions'}
+
+
+# Same as _book_from_tree, but built from _iterparse_book.
+#
+# Reading stops early if the rest of the file is not selected: with
+# GNU Cash's order of elements, the price database is complete when the
+# accounts start, and the accounts are complete with the first
+# transaction.
+#
+# Slot frames are decoded as they are read unless keep_tree is true:
+# holding on to the discarded XML for later decoding would take several
+# times the memory of the decoded slots.
+def _book_from_iterparse(fobj, parse_number, selection, keep_tree=False,
+                         etree=ElementTree, stats=None):
+    tree = None
+    guid = None
+    slots = {}
+    commodities = []
+    commoditydict = {}
+    prices = []
+    pricedb = False
+    root_account = None
+    accountdict = {}
+    parentdict = {}
+    accounts = None
+    transactions = []
+    selected = None
+
+    for elem in _iterparse_book(fobj, keep_tree, etree):
+        tag = elem.tag
+        if stats is not None:
+            stats._enter(_PHASES.get(tag, 'book'))
+        if tag == _GNC_TRANSACTION:
+            if accounts is None:
+                if stats is not None:
+                    stats._enter('links')
+                accounts = _link_accounts(accountdict, parentdict)
+                selected = selection.transaction_filter(root_account)
+                if stats is not None:
+                    stats._enter('transactions')
+            if not selection.transactions:
+                if pricedb or not selection.prices:
+                    break
+            elif selected is None or selected(elem):
+                transactions.append(_transaction_from_tree(elem,
+                                                           accountdict,
+                                                           commoditydict,
+                                                           parse_number,
+                                                           lazy_slots=keep_tree))
+        elif tag == _GNC_ACCOUNT:
+            if not selection.accounts:
+                if pricedb or not selection.prices:
+                    break
+                continue
+            parent_guid, acc = _account_from_tree(elem, commoditydict,
+                                                  lazy_slots=keep_tree)
+            if acc.actype == 'ROOT':
+                root_account = acc
+            accountdict[acc.guid] = acc
+            parentdict[acc.guid] = parent_guid
+        elif tag == 'price':
+            if selection.prices:
+                prices.append(_price_from_tree(elem, commoditydict, parse_number))
+        elif tag == _GNC_PRICEDB:
+            pricedb = True
+        elif tag == _GNC_COMMODITY:
+            commodity = _commodity_from_tree(elem)
+            commodities.append(commodity)
+            commoditydict[(commodity.space, commodity.symbol)] = commodity
+        elif tag == _BOOK_ID:
+            guid = elem.text
+        elif tag == _BOOK_SLOTS:
+            slots = _slots_from_tree(elem)
+        elif tag == _GNC_BOOK and keep_tree:
+            tree = elem
+
+    if guid is None:
+        raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+    if accounts is None:
+        if stats is not None:
+            stats._enter('links')
+        accounts = _link_accounts(accountdict, parentdict)
+    if stats is not None:
+        stats._enter('index')
+    return Book(tree=tree,
+                guid=guid,
+                prices=prices,
+                transactions=transactions,
+                root_account=root_account,
+                accounts=accounts,
+                commodities=commodities,
+                slots=slots,
+                accountdict=accountdict,
+                commoditydict=commoditydict)
+
+
+# GNU Cash writes all transactions of a book in one run, after the
+# accounts and before template transactions, scheduled transactions
+# and budgets. Text cannot contain a literal "<", so these patterns
+# only match tags.
+_TRANSACTION_START = re.compile(rb'<gnc:transaction[\s>]')
+_TRANSACTION_END = b'</gnc:transaction>'
+_TRANSACTIONS_END = re.compile(rb'<gnc:template-transactions[\s>]|'
+                               rb'<gnc:schedxaction[\s>]|'
+                               rb'<gnc:budget[\s>]|'
+                               rb'</gnc:book>')
+
+
+# Same as _book_from_iterparse, but with the transactions cut out of
+# the file into chunks which are parsed by a pool of processes. The
+# rest of the file is parsed in this process.
+def _book_from_parallel(fobj, exact, workers, selection, backend, stats=None):
+    parse_number = _parse_fraction if exact else _parse_number
+    etree = _BACKENDS[backend]
+    data = fobj.read()
+    # Template transactions come after the book's own, if any
+    limit = _book_limit(data)
+    match = _TRANSACTION_START.search(data, 0, limit)
+    if match is None:
+        return _book_from_iterparse(io.BytesIO(data), parse_number, selection,
+                                    etree=etree, stats=stats)
+    start = match.start()
+    end = data.rfind(_TRANSACTION_END, start, limit) + len(_TRANSACTION_END)
+
+    head = _book_from_iterparse(io.BytesIO(data[:start] + data[end:]), parse_number,
+                                selection, etree=etree, stats=stats)
+    guids = selection.account_guids(head.root_account)
+
+    # Chunks are wrapped in the original root tag for its namespaces
+    rootstart = data.index(b'<gnc-v2')
+    root = data[rootstart:data.index(b'>', rootstart) + 1]
+    chunks = []
+    size = max((end - start) // (workers * 4), 1)
+    while start < end:
+        cut = data.find(_TRANSACTION_END, min(start + size, end), end)
+        cut = end if cut < 0 else cut + len(_TRANSACTION_END)
+        chunks.append(root + data[start:cut] + b'</gnc-v2>')
+        start = cut
+    del data
+
+    if stats is not None:
+        stats._enter('transactions')
+    transactions = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        try:
+            for states in executor.map(_transactions_from_chunk, chunks,
+                                       itertools.repeat(exact),
+                                       itertools.repeat(selection.since),
+                                       itertools.repeat(selection.until),
+                                       itertools.repeat(guids),
+                                       itertools.repeat(backend)):
+                for fields in states:
+                    transactions.append(_transaction_from_state(fields,
+                                                                head._commoditydict,
+                                                                head._accountdict))
+        except _PARSE_ERRORS:
+            raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+
+    if stats is not None:
+        stats._enter('index')
+    return Book(tree=None,
+                guid=head.guid,
+                prices=head.prices,
+                transactions=transactions,
+                root_account=head.root_account,
+                accounts=head.accounts,
+                commodities=head.commodities,
+                slots=head.slots,
+                accountdict=head._accountdict,
+                commoditydict=head._commoditydict)
+
+
+class _Keys(dict):
+    """Dict which returns missing keys themselves."""
+
+    def __missing__(self, key):
+        return key
+
+
+# Worker side of _book_from_parallel. Without the account tree, the
+# accounts of splits and the currencies of transactions are left as
+# GUIDs and (space, symbol) keys, and resolved by the caller.
+def _transactions_from_chunk(chunk, exact, since, until, guids, backend):
+    parse_number = _parse_fraction if exact else _parse_number
+    selected = _transaction_prefilter(since, until, guids)
+    keys = _Keys()
+    return [_transaction_to_state(_transaction_from_tree(elem, keys, keys,
+                                                         parse_number,
+                                                         link=False),
+                                  keys, keys)
+            for elem in _BACKENDS[backend].fromstring(chunk)
+            if selected is None or selected(elem)]
+
+
+def _link_accounts(accountdict, parentdict):
+    """Attach accounts to their parents and return all non-root accounts."""
+    accounts = []
+    for acc in list(accountdict.values()):
+        if acc.parent is None and acc.actype != 'ROOT':
+            parent = accountdict[parentdict[acc.guid]]
+            # Nothing is indexed or cached yet, skip the invalidation
+            acc._parent = parent
+            parent.children.append(acc)
+            accounts.append(acc)
+    return accounts
+
+
+##################################################################
+# Incremental reload
+
+# Start tag, end tag and GUID of the elements which Book.refresh()
+# compares one by one. Accounts and transactions are only looked for
+# before _TRANSACTIONS_END, as template transactions have them, too.
+_COMMODITY_START = re.compile(rb'<gnc:commodity[\s>]')
+_BOOK_SLOTS_START = re.compile(rb'<book:slots[\s>]')
+_ELEMENTS = {
+    'accounts': (re.compile(rb'<gnc:account[\s>]'), b'</gnc:account>',
+                 re.compile(rb'<act:id[^>]*>([^<]*)</act:id>')),
+    'prices': (re.compile(rb'<price[\s>]'), b'</price>',
+               re.compile(rb'<price:id[^>]*>([^<]*)</price:id>')),
+    'transactions': (_TRANSACTION_START, _TRANSACTION_END,
+                     re.compile(rb'<trn:id[^>]*>([^<]*)</trn:id>')),
+}
+
+
+def _element_spans(data, start, end_tag, pos, limit):
+    """Generate (start, end) offsets of the elements between pos and limit."""
+    while True:
+        match = start.search(data, pos, limit)
+        if match is None:
+            return
+        pos = data.index(end_tag, match.end()) + len(end_tag)
+        yield match.start(), pos
+
+
+def _book_limit(data):
+    match = _TRANSACTIONS_END.search(data)
+    return len(data) if match is None else match.start()
+
+
+def _book_spans(data):
+    """Map each kind of element to {guid: (digest, start, end)}."""
+    limit = _book_limit(data)
+    view = memoryview(data)
+    spans = {}
+    for kind, (start, end_tag, guid_pattern) in _ELEMENTS.items():
+        found = spans[kind] = {}
+        for first, last in _element_spans(data, start, end_tag, 0, limit):
+            guid = guid_pattern.search(data, first, last).group(1).decode('ascii')
+            digest = hashlib.blake2b(view[first:last], digest_size=16).digest()
+            found[guid] = (digest, first, last)
+    return spans
+
+
+def _fingerprints(spans):
+    return {kind: {guid: digest for guid, (digest, start, end) in found.items()}
+            for kind, found in spans.items()}
+
+
+def _refresh_book(book, data, parse_number):
+    try:
+        rootstart = data.index(b'<gnc-v2')
+        root = data[rootstart:data.index(b'>', rootstart) + 1]
+        spans = _book_spans(data)
+    except (ValueError, AttributeError):
+        raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+    limit = _book_limit(data)
+    fingerprints = book._fingerprints or {}
+    changes = {}
+
+    # Elements are wrapped in the original root tag for its namespaces
+    def element(start, end):
+        try:
+            return ElementTree.fromstring(root + data[start:end] + b'</gnc-v2>')[0]
+        except _PARSE_ERRORS:
+            raise ValueError("File stream was not a valid GNU Cash v2 XML file")
+
+    def diff(kind, existing):
+        current = spans[kind]
+        old = fingerprints.get(kind, {})
+        added = []
+        changed = []
+        for guid, (digest, start, end) in current.items():
+            if guid not in existing:
+                added.append(guid)
+            elif old.get(guid) != digest:
+                changed.append(guid)
+        removed = [guid for guid in existing if guid not in current]
+        changes[kind] = {'added': added, 'changed': changed, 'removed': removed}
+        return added, changed, removed
+
+    def parsed(kind, guid):
+        digest, start, end = spans[kind][guid]
+        return element(start, end)
+
+    # Commodities are reloaded as a whole. Changed ones are new objects,
+    # which replace the old ones wherever these are referenced.
+    commodities = [_commodity_from_tree(element(start, end))
+                   for start, end in _element_spans(data, _COMMODITY_START,
+                                                    b'</gnc:commodity>', 0, limit)]
+    current = {(c.space, c.symbol): c for c in commodities}
+    commoditydict = book._commoditydict
+    replaced = {commodity: current[key] for key, commodity in commoditydict.items()
+                if current.get(key, commodity) is not commodity}
+    commoditydict.clear()
+    commoditydict.update(current)
+    book.commodities[:] = commodities
+    if replaced:
+        for acc in book._accountdict.values():
+            acc.commodity = replaced.get(acc.commodity, acc.commodity)
+        for trn in book.transactions:
+            trn.currency = replaced.get(trn.currency, trn.currency)
+        for price in book.prices or ():
+            price.commodity = replaced.get(price.commodity, price.commodity)
+            price.currency = replaced.get(price.currency, price.currency)
+        book._priceindex = None
+    book.slots = _EMPTY_SLOTS
+    for start, end in _element_spans(data, _BOOK_SLOTS_START, b'</book:slots>',
+                                     0, limit):
+        book.slots = _slots_from_tree(element(start, end))
+        break
+
+    # Accounts keep their identity, so that splits and user code which
+    # refer to them stay valid.
+    accountdict = book._accountdict
+    added, changed, removed = diff('accounts', accountdict)
+    for guid in removed:
+        acc = accountdict.pop(guid)
+        if acc.parent is not None:
+            acc.parent.children.remove(acc)
+            acc.parent = None
+    parents = []
+    for guid in added + changed:
+        parent_guid, acc = _account_from_tree(parsed('accounts', guid), commoditydict)
+        target = accountdict.get(guid)
+        if target is None:
+            target = accountdict[guid] = acc
+            if acc.actype == 'ROOT':
+                book.root_account = acc
+        else:
+            if target.name != acc.name:
+                target.name = acc.name
+            target.actype = acc.actype
+            target.description = acc.description
+            target.commodity = acc.commodity
+            target.commodity_scu = acc.commodity_scu
+            target._slots = acc._slots
+        parents.append((target, parent_guid))
+    for acc, parent_guid in parents:
+        parent = None if parent_guid is None else accountdict[parent_guid]
+        if acc.parent is not parent:
+            if acc.parent is not None:
+                acc.parent.children.remove(acc)
+            acc.parent = parent
+            if parent is not None:
+                parent.children.append(acc)
+    if added or removed:
+        book.accounts[:] = [acc for acc in accountdict.values()
+                            if acc.actype != 'ROOT']
+
+    added, changed, removed = diff('prices', book._pricedict)
+    if book.prices is None:
+        book.prices = []
+    gone = set(changed).union(removed)
+    if gone:
+        book.prices[:] = [price for price in book.prices if price.guid not in gone]
+        for guid in gone:
+            del book._pricedict[guid]
+    for guid in added + changed:
+        price = _price_from_tree(parsed('prices', guid), commoditydict, parse_number)
+        book.prices.append(price)
+        book._pricedict[guid] = price
+    if gone or added:
+        book._priceindex = None
+    # As in a load, currencies found only in the price database are
+    # indexed too
+    for price in book.prices:
+        commoditydict.setdefault((price.currency.space, price.currency.symbol),
+                                 price.currency)
+
+    # Splits of dropped transactions are filtered out of their accounts
+    # and the splits of new ones appended; only the accounts touched are
+    # sorted again.
+    added, changed, removed = diff('transactions', book._transactiondict)
+    gone = set(changed).union(removed)
+    touched = {}
+    if gone:
+        for guid in gone:
+            for spl in book._transactiondict.pop(guid).splits:
+                del book._splitdict[spl.guid]
+                touched.setdefault(spl.account, set()).add(spl)
+        book.transactions[:] = [trn for trn in book.transactions
+                                if trn.guid not in gone]
+        for account, splits in touched.items():
+            account.splits[:] = [spl for spl in account.splits
+                                 if spl not in splits]
+    for guid in added + changed:
+        trn = _transaction_from_tree(parsed('transactions', guid), accountdict,
+                                     commoditydict, parse_number)
+        book.transactions.append(trn)
+        book._transactiondict[guid] = trn
+        for spl in trn.splits:
+            book._splitdict[spl.guid] = spl
+            touched.setdefault(spl.account, set())
+    if added or changed:
+        book.transactions.sort(key=_transaction_date)
+    for account in touched:
+        account.splits.sort(key=_split_date)
+        account._dates = None
+        account._balances = None
+
+    book.tree = None
+    book._fingerprints = _fingerprints(spans)
+    return changes
+
+
+# Implemented:
+# - cmdty:space
+# - cmdty:id => Symbol
+# - cmdty:name
+# - cmdty:xcode => optional, e.g. ISIN/WKN
+#
+# Not implemented:
+# - cmdty:get_quotes => unknown, empty, optional
+# - cmdty:quote_tz => unknown, empty, optional
+# - cmdty:source => text, optional, e.g. "currency"
+# - cmdty:fraction => optional, e.g. "1"
+def _commodity_from_tree(tree):
+    space = tree.find(_CMDTY_SPACE).text
+    symbol = tree.find(_CMDTY_ID).text
+    name = xcode = None
+    try:
+        name = tree.find(_CMDTY_NAME).text
+    except AttributeError:
+        pass
+
+    try:
+        xcode = tree.find(_CMDTY_XCODE).text
+    except AttributeError:
+        pass
+
+    return _shared_commodity(space, symbol, name, xcode)
+
+
+def _commodity_key(tree):
+    """Return (space, symbol) of a commodity reference."""
+    return tree.find(_CMDTY_SPACE).text, tree.find(_CMDTY_ID).text
+
+
+# The elements below are read by iterating over their children once
+# and dispatching on the tag, rather than with one find() per field.
+#
+# Implemented:
+# - price
+# - price:guid
+# - price:commodity
+# - price:currency
+# - price:date
+# - price:value
+def _price_from_tree(tree, commoditydict, parse_number):
+    guid = value = date = currency_key = commodity_key = None
+    for child in tree:
+        tag = child.tag
+        if tag == _PRICE_ID:
+            guid = child.text
+        elif tag == _PRICE_VALUE:
+            value = parse_number(child.text)
+        elif tag == _PRICE_TIME:
+            date = _parse_date(child.find(_TS_DATE).text)
+        elif tag == _PRICE_CURRENCY:
+            currency_key = _commodity_key(child)
+        elif tag == _PRICE_COMMODITY:
+            commodity_key = _commodity_key(child)
+
+    # pricedb may contain currencies not part of the commodities root list
+    currency = commoditydict.get(currency_key)
+    if currency is None:
+        currency = commoditydict[currency_key] = _shared_commodity(*currency_key)
+    commodity = commoditydict[commodity_key]
+
+    return Price(guid=guid,
+                 commodity=commodity,
+                 date=date,
+                 value=value,
+                 currency=currency)
 
 
 # Implemented:
@@ -443,29 +2754,23 @@ def _book_from_tree(tree):
 # - act:commodity-scu
 # - act:parent
 # - act:slots
-def _account_from_tree(tree, commoditydict):
-    act = '{http://www.gnucash.org/XML/act}'
-    cmdty = '{http://www.gnucash.org/XML/cmdty}'
-
-    name = tree.find(act + 'name').text
-    guid = tree.find(act + 'id').text
-    actype = tree.find(act + 'type').text
-    description = tree.find(act + "description")
+def _account_from_tree(tree, commoditydict, lazy_slots=False):
+    name = tree.find(_ACT_NAME).text
+    guid = tree.find(_ACT_ID).text
+    actype = sys.intern(tree.find(_ACT_TYPE).text)
+    description = tree.find(_ACT_DESCRIPTION)
     if description is not None:
         description = description.text
-    slots = _slots_from_tree(tree.find(act + 'slots'))
+    slots = tree.find(_ACT_SLOTS)
+    slots = _lazy_slots(slots) if lazy_slots else _slots_from_tree(slots)
     if actype == 'ROOT':
         parent_guid = None
         commodity = None
         commodity_scu = None
     else:
-        parent_guid = tree.find(act + 'parent').text
-        commodity_space = tree.find(act + 'commodity/' +
-                                    cmdty + 'space').text
-        commodity_name = tree.find(act + 'commodity/' +
-                                   cmdty + 'id').text
-        commodity_scu = tree.find(act + 'commodity-scu').text
-        commodity = commoditydict[(commodity_space, commodity_name)]
+        parent_guid = tree.find(_ACT_PARENT).text
+        commodity = commoditydict[_commodity_key(tree.find(_ACT_COMMODITY))]
+        commodity_scu = tree.find(_ACT_COMMODITY_SCU).text
     return parent_guid, Account(name=name,
                                 description=description,
                                 guid=guid,
@@ -483,30 +2788,31 @@ def _account_from_tree(tree, commoditydict):
 # - trn:description
 # - trn:splits / trn:split
 # - trn:slots
-def _transaction_from_tree(tree, accountdict, commoditydict):
-    trn = '{http://www.gnucash.org/XML/trn}'
-    cmdty = '{http://www.gnucash.org/XML/cmdty}'
-    ts = '{http://www.gnucash.org/XML/ts}'
-    split = '{http://www.gnucash.org/XML/split}'
-
-    guid = tree.find(trn + "id").text
-    currency_space = tree.find(trn + "currency/" +
-                               cmdty + "space").text
-    currency_name = tree.find(trn + "currency/" +
-                              cmdty + "id").text
-    currency = commoditydict[(currency_space, currency_name)]
-    date = parse_date(tree.find(trn + "date-posted/" +
-                                ts + "date").text)
-    date_entered = parse_date(tree.find(trn + "date-entered/" +
-                                        ts + "date").text)
-    description = tree.find(trn + "description").text
-
-    # rarely used
-    num = tree.find(trn + "num")
-    if num is not None:
-        num = num.text
-
-    slots = _slots_from_tree(tree.find(trn + "slots"))
+def _transaction_from_tree(tree, accountdict, commoditydict, parse_number,
+                           link=True, lazy_slots=False):
+    guid = currency = date = date_entered = description = num = None
+    slots = _EMPTY_SLOTS
+    splits = ()
+    for child in tree:
+        tag = child.tag
+        if tag == _TRN_ID:
+            guid = child.text
+        elif tag == _TRN_CURRENCY:
+            currency = commoditydict[_commodity_key(child)]
+        elif tag == _TRN_DATE_POSTED:
+            date = _parse_date(child.find(_TS_DATE).text)
+        elif tag == _TRN_DATE_ENTERED:
+            date_entered = _parse_date(child.find(_TS_DATE).text)
+        elif tag == _TRN_DESCRIPTION:
+            description = child.text
+        elif tag == _TRN_SPLITS:
+            splits = child
+        elif tag == _TRN_NUM:
+            # rarely used
+            num = child.text
+        elif tag == _TRN_SLOTS:
+            slots = _lazy_slots(child) if lazy_slots else _slots_from_tree(child)
+
     transaction = Transaction(guid=guid,
                               currency=currency,
                               date=date,
@@ -515,9 +2821,16 @@ def _transaction_from_tree(tree, accountdict, commoditydict):
                               num=num,
                               slots=slots)
 
-    for subtree in tree.findall(trn + "splits/" + trn + "split"):
-        split = _split_from_tree(subtree, accountdict, transaction)
+    for subtree in splits:
+        if subtree.tag != _TRN_SPLIT:
+            continue
+        split = _split_from_tree(subtree, accountdict, transaction,
+                                 parse_number, lazy_slots)
         transaction.splits.append(split)
+        # Unlinked transactions are not referenced from Account.splits,
+        # so they can be garbage collected once the caller is done
+        if link:
+            split.account.splits.append(split)
 
     return transaction
 
@@ -531,26 +2844,33 @@ def _transaction_from_tree(tree, accountdict, commoditydict):
 # - split:quantity
 # - split:account
 # - split:slots
-def _split_from_tree(tree, accountdict, transaction):
-    split = '{http://www.gnucash.org/XML/split}'
-    ts = "{http://www.gnucash.org/XML/ts}"
-
-    guid = tree.find(split + "id").text
-    memo = tree.find(split + "memo")
-    if memo is not None:
-        memo = memo.text
-    reconciled_state = tree.find(split + "reconciled-state").text
-    reconcile_date = tree.find(split + "reconcile-date/" + ts + "date")
-    if reconcile_date is not None:
-        reconcile_date = parse_date(reconcile_date.text)
-    value = _parse_number(tree.find(split + "value").text)
-    quantity = _parse_number(tree.find(split + "quantity").text)
-    account_guid = tree.find(split + "account").text
-    account = accountdict[account_guid]
-    slots = _slots_from_tree(tree.find(split + "slots"))
-    action = tree.find(split + "action")
-    if action is not None:
-        action = action.text
+def _split_from_tree(tree, accountdict, transaction, parse_number,
+                     lazy_slots=False):
+    guid = memo = reconciled_state = reconcile_date = None
+    value = quantity = account = action = None
+    slots = _EMPTY_SLOTS
+    for child in tree:
+        tag = child.tag
+        if tag == _SPLIT_ID:
+            guid = child.text
+        elif tag == _SPLIT_VALUE:
+            value = parse_number(child.text)
+        elif tag == _SPLIT_QUANTITY:
+            quantity = parse_number(child.text)
+        elif tag == _SPLIT_ACCOUNT:
+            account = accountdict[child.text]
+        elif tag == _SPLIT_RECONCILED_STATE:
+            reconciled_state = sys.intern(child.text)
+        elif tag == _SPLIT_MEMO:
+            memo = child.text
+        elif tag == _SPLIT_RECONCILE_DATE:
+            reconcile_date = child.find(_TS_DATE)
+            if reconcile_date is not None:
+                reconcile_date = _parse_date(reconcile_date.text)
+        elif tag == _SPLIT_ACTION:
+            action = child.text and sys.intern(child.text)
+        elif tag == _SPLIT_SLOTS:
+            slots = _lazy_slots(child) if lazy_slots else _slots_from_tree(child)
 
     split = Split(guid=guid,
                   memo=memo,
@@ -562,7 +2882,6 @@ def _split_from_tree(tree, accountdict, transaction):
                   transaction=transaction,
                   action=action,
                   slots=slots)
-    account.splits.append(split)
     return split
 
 
@@ -575,13 +2894,17 @@ def _split_from_tree(tree, accountdict, transaction):
 # - list
 def _slots_from_tree(tree):
     if tree is None:
-        return {}
-    slot = "{http://www.gnucash.org/XML/slot}"
-    ts = "{http://www.gnucash.org/XML/ts}"
+        return _EMPTY_SLOTS
     slots = {}
-    for elt in tree.findall("slot"):
-        key = elt.find(slot + "key").text
-        value = elt.find(slot + "value")
+    for elt in tree:
+        if elt.tag != 'slot':
+            continue
+        key = value = None
+        for child in elt:
+            if child.tag == _SLOT_KEY:
+                key = child.text
+            elif child.tag == _SLOT_VALUE:
+                value = child
         type_ = value.get('type', 'string')
         if type_ in ('integer', 'double'):
             slots[key] = int(value.text)
@@ -590,18 +2913,325 @@ def _slots_from_tree(tree):
         elif type_ in ('string', 'guid'):
             slots[key] = value.text
         elif type_ == 'gdate':
-            slots[key] = parse_date(value.find("gdate").text)
+            slots[key] = _parse_date(value.find("gdate").text)
         elif type_ == 'timespec':
-            slots[key] = parse_date(value.find(ts + "date").text)
+            slots[key] = _parse_date(value.find(_TS_DATE).text)
         elif type_ == 'frame':
             slots[key] = _slots_from_tree(value)
         elif type_ == 'list':
-            slots[key] = [_slots_from_tree(lelt) for lelt in value.findall(slot + "value")]
+            slots[key] = [_slots_from_tree(lelt) for lelt in value
+                          if lelt.tag == _SLOT_VALUE]
         else:
             raise RuntimeError("Unknown slot type {}".format(type_))
-    return slots
+    return slots or _EMPTY_SLOTS
 
 
+# Amounts such as "0/1" or "-5000/100" repeat heavily, and Decimal and
+# Fraction objects are immutable, so conversions are memoized. The
+# handful of denominators in a book (commodity SCUs) are interned.
+#
+# Building the Decimal by shifting the exponent of the numerator for
+# power of ten denominators was tried, but is slower than the C
+# implementation of Decimal division once the exponent has to be
+# matched to what division produces ("-5000/100" => Decimal("-50")).
+_denominators = {}
+
+
+@functools.lru_cache(maxsize=65536)
 def _parse_number(numstring):
     num, denum = numstring.split("/")
-    return decimal.Decimal(num) / decimal.Decimal(denum)
+    if denum == '1':
+        return decimal.Decimal(num)
+    try:
+        denominator = _denominators[denum]
+    except KeyError:
+        denominator = _denominators.setdefault(denum, decimal.Decimal(denum))
+    return decimal.Decimal(num) / denominator
+
+
+@functools.lru_cache(maxsize=65536)
+def _parse_fraction(numstring):
+    num, denum = numstring.split("/")
+    return fractions.Fraction(int(num), int(denum))
+
+
+def _decimal(number):
+    """Return number as a Decimal, which Fraction of exact=True is not."""
+    if isinstance(number, decimal.Decimal):
+        return number
+    # Fraction.__format__ only supports 'f' from Python 3.12 on
+    return decimal.Decimal(number.numerator) / number.denominator
+
+
+_INT64 = 2**63
+
+
+def _integer_ratio(number):
+    """Return numerator and denominator of number in lowest terms.
+
+    None if they do not fit in int64: a Decimal of a fraction such as
+    "100/3" is rounded to 28 digits, while a Fraction (exact=True) keeps
+    the fraction of the file.
+    """
+    num, denom = number.as_integer_ratio()
+    if -_INT64 <= num < _INT64 and denom < _INT64:
+        return num, denom
+    return None
+
+
+# GNU Cash writes timestamps as "YYYY-MM-DD HH:MM:SS +ZZZZ" and dates
+# (gdate) as "YYYY-MM-DD". Both are parsed by slicing, and anything
+# else is left to dateutil. Posting dates and gdates repeat a lot, so
+# results are memoized; datetime objects are immutable and can be
+# shared.
+@functools.lru_cache(maxsize=65536)
+def _parse_date(datestring):
+    try:
+        if (len(datestring) == 25 and datestring[4] == '-' and
+                datestring[7] == '-' and datestring[10] == ' ' and
+                datestring[13] == ':' and datestring[16] == ':' and
+                datestring[19] == ' ' and datestring[20] in '+-'):
+            return datetime.datetime(int(datestring[0:4]),
+                                     int(datestring[5:7]),
+                                     int(datestring[8:10]),
+                                     int(datestring[11:13]),
+                                     int(datestring[14:16]),
+                                     int(datestring[17:19]),
+                                     tzinfo=_timezone(datestring[20:25]))
+        if (len(datestring) == 10 and datestring[4] == '-' and
+                datestring[7] == '-'):
+            return datetime.datetime(int(datestring[0:4]),
+                                     int(datestring[5:7]),
+                                     int(datestring[8:10]))
+    except ValueError:
+        pass
+    return parse_date(datestring)
+
+
+@functools.lru_cache(maxsize=None)
+def _timezone(offset):
+    minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+    if minutes == 0:
+        return datetime.timezone.utc
+    if offset[0] == '-':
+        minutes = -minutes
+    return datetime.timezone(datetime.timedelta(minutes=minutes))
+
+
+##################################################################
+# Cache of parsed books
+#
+# A cache file holds two pickles: a header identifying the file it was
+# made from, and the book flattened into lists of tuples which refer to
+# each other by index. Pickling the object graph directly recurses
+# along split => transaction => split => account chains and easily
+# overflows the stack on large books.
+
+# Increase when the flattened format changes
+_CACHE_FORMAT = 2
+
+
+def _from_cache(filename, cache_dir, cache_size, kwargs):
+    stats = kwargs.get('stats')
+    key = repr((os.path.abspath(filename),
+                sorted(item for item in kwargs.items() if item[0] != 'stats')))
+    cachefile = os.path.join(cache_dir,
+                             hashlib.sha256(key.encode('utf-8')).hexdigest() + '.gnccache')
+    stat = os.stat(filename)
+    header = {'format': _CACHE_FORMAT,
+              'version': __version__,
+              'size': stat.st_size,
+              'mtime': stat.st_mtime_ns,
+              'sha256': None}
+    try:
+        with open(cachefile, 'rb') as fobj:
+            cached = pickle.load(fobj)
+            if all(cached[field] == header[field]
+                   for field in ('format', 'version', 'size', 'mtime')):
+                header['sha256'] = _file_digest(filename)
+                if cached['sha256'] == header['sha256']:
+                    book = None
+                    if stats is not None:
+                        stats._begin()
+                        stats._enter('cache')
+                    try:
+                        book = _book_from_state(pickle.load(fobj))
+                    finally:
+                        if stats is not None:
+                            stats._end(book)
+                    book.stats = stats
+                    # Mark as recently used for eviction
+                    os.utime(cachefile)
+                    return book
+    except Exception:
+        # A missing, stale or broken cache entry is just a miss
+        pass
+
+    if header['sha256'] is None:
+        header['sha256'] = _file_digest(filename)
+    book = from_filename(filename, **kwargs)
+    book.tree = None
+
+    # Do not store a book that was parsed from a file changing under us
+    stat = os.stat(filename)
+    if stat.st_size == header['size'] and stat.st_mtime_ns == header['mtime']:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fobj:
+                pickle.dump(header, fobj, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(_book_to_state(book), fobj, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpname, cachefile)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+        _evict_cache(cache_dir, cache_size, keep=cachefile)
+    return book
+
+
+def _file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fobj:
+        for block in iter(lambda: fobj.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _evict_cache(cache_dir, cache_size, keep):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.gnccache'):
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= cache_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def _book_to_state(book):
+    commodities = list(book._commoditydict.values())
+    commodityindex = {c: i for i, c in enumerate(commodities)}
+    commodityindex[None] = None
+    accounts = list(book._accountdict.values())
+    accountindex = {a: i for i, a in enumerate(accounts)}
+    accountindex[None] = None
+
+    return {
+        'guid': book.guid,
+        'slots': book.slots or None,
+        'commodities': [(c.space, c.symbol, c.name, c.xcode) for c in commodities],
+        'book_commodities': [commodityindex[c] for c in book.commodities],
+        'accounts': [(a.name, a.guid, a.actype, accountindex[a.parent],
+                      commodityindex[a.commodity], a.commodity_scu,
+                      a.description, a.slots or None)
+                     for a in accounts],
+        'book_accounts': [accountindex[a] for a in book.accounts],
+        'root_account': accountindex[book.root_account],
+        'transactions': [_transaction_to_state(trn, commodityindex, accountindex)
+                         for trn in book.transactions],
+        'prices': [(price.guid, commodityindex[price.commodity],
+                    commodityindex[price.currency], price.date, price.value)
+                   for price in book.prices or ()],
+        # For Book.refresh(), so that a cached book refreshes incrementally
+        'fingerprints': book._fingerprints,
+    }
+
+
+def _book_from_state(state):
+    commodities = [_shared_commodity(space, symbol, name, xcode)
+                   for space, symbol, name, xcode in state['commodities']]
+
+    accounts = []
+    for (name, guid, actype, parent, commodity, commodity_scu,
+         description, slots) in state['accounts']:
+        accounts.append(Account(name=name,
+                                guid=guid,
+                                actype=actype,
+                                commodity=None if commodity is None else commodities[commodity],
+                                commodity_scu=commodity_scu,
+                                description=description,
+                                slots=slots))
+    for account, fields in zip(accounts, state['accounts']):
+        parent = fields[3]
+        if parent is not None:
+            # Nothing is indexed or cached yet, skip the invalidation
+            account._parent = accounts[parent]
+            accounts[parent].children.append(account)
+
+    transactions = [_transaction_from_state(fields, commodities, accounts)
+                    for fields in state['transactions']]
+
+    prices = [Price(guid=guid,
+                    commodity=commodities[commodity],
+                    currency=commodities[currency],
+                    date=date,
+                    value=value)
+              for guid, commodity, currency, date, value in state['prices']]
+
+    book = Book(tree=None,
+                guid=state['guid'],
+                prices=prices,
+                transactions=transactions,
+                root_account=(None if state['root_account'] is None
+                              else accounts[state['root_account']]),
+                accounts=[accounts[i] for i in state['book_accounts']],
+                commodities=[commodities[i] for i in state['book_commodities']],
+                slots=state['slots'],
+                accountdict={account.guid: account for account in accounts},
+                commoditydict={(c.space, c.symbol): c for c in commodities})
+    book._fingerprints = state['fingerprints']
+    return book
+
+
+# Transactions are flattened to tuples which refer to their currency
+# and accounts through commodityindex and accountindex. Lists or dicts
+# of Commodity and Account objects turn them back.
+def _transaction_to_state(trn, commodityindex, accountindex):
+    return (trn.guid, commodityindex[trn.currency],
+            trn.date, trn.date_entered, trn.description,
+            trn.num, trn.slots or None,
+            [(spl.guid, spl.memo, spl.reconciled_state,
+              spl.reconcile_date, spl.value, spl.quantity,
+              accountindex[spl.account], spl.action,
+              spl.slots or None)
+             for spl in trn.splits])
+
+
+def _transaction_from_state(fields, commodities, accounts):
+    (guid, currency, date, date_entered, description, num, slots,
+     splits) = fields
+    transaction = Transaction(guid=guid,
+                              currency=commodities[currency],
+                              date=date,
+                              date_entered=date_entered,
+                              description=description,
+                              num=num,
+                              slots=slots)
+    for (guid, memo, reconciled_state, reconcile_date, value, quantity,
+         account, action, slots) in splits:
+        account = accounts[account]
+        split = Split(guid=guid,
+                      memo=memo,
+                      reconciled_state=reconciled_state,
+                      reconcile_date=reconcile_date,
+                      value=value,
+                      quantity=quantity,
+                      account=account,
+                      transaction=transaction,
+                      action=action,
+                      slots=slots)
+        transaction.splits.append(split)
+        account.splits.append(split)
+    return transaction
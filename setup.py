@@ -3,7 +3,10 @@
 import os
 import shutil
 
-from distutils.core import setup
+try:
+    from setuptools import setup
+except ImportError:
+    from distutils.core import setup
 
 if not os.path.exists("README.txt"):
     shutil.copy("README.md", "README.txt")
@@ -16,9 +19,23 @@ setup(name='gnucashxml',
       author_email="forcer@forcix.cx",
       url="https://github.com/jorgenschaefer/gnucashxml",
       py_modules=['gnucashxml'],
+      python_requires='>=3.9',
       install_requires=[
           'python-dateutil'
       ],
+      extras_require={
+          'lxml': ['lxml'],
+          'numpy': ['numpy'],
+          'pandas': ['numpy', 'pandas'],
+      },
+      entry_points={
+          'console_scripts': [
+              'gnucashxml-ledger = gnucashxml:ledger_main',
+              'gnucashxml-multicolumn = gnucashxml:multicolumn_main',
+              'gnucashxml-profile = gnucashxml:profile_main',
+              'gnucashxml-sqlite = gnucashxml:sqlite_main',
+          ],
+      },
       classifiers=[
           "Development Status :: 4 - Beta",
           "Intended Audience :: Developers",